@@ -4,23 +4,57 @@ import sys
 import os
 picdir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'pic')
 libdir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'lib')
+fontdir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'fonts')
 
 if os.path.exists(libdir):
     sys.path.append(libdir)
 
 import logging
-from waveshare_epd import epd7in5_V2
+from waveshare_epd import epd7in5_V2, epdcalibration, epdconfig
 import time
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageChops, ImageDraw, ImageFont
 from enum import Enum
 import asyncio
+import heapq
+import math
 from aiohttp import web
 from typing import Any, Coroutine, NamedTuple, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from io import BytesIO
 
 
 logging.basicConfig(level=logging.DEBUG)
 PORT = 8080
+# Maximum number of events waiting for the UI loop before producers block.
+QUEUE_SIZE = 64
+# Seconds to wait for further widget changes before refreshing the display.
+COALESCE_DELAY = 0.05
+# Estimated seconds a partial refresh takes regardless of its size until the
+# panel has been calibrated, and the seconds it takes to transfer a single
+# byte over the 4 MHz SPI bus.
+REFRESH_COST = 1.0
+BYTE_COST = 8 / 4000000
+# Seconds without events after which the display counts as idle and cleanup
+# refreshes may run.
+IDLE_DELAY = 10.0
+# Partial refreshes an area may receive before it is cleaned up with a fast
+# refresh to remove ghosting. They are counted per square tile of
+# REFRESH_TILE pixels, as refreshed regions rarely repeat exactly.
+MAX_PARTIAL_REFRESHES = 60
+REFRESH_TILE = 80
+# Seconds between full refreshes. During the quiet hours, when nobody is
+# expected to look at the display, the full refresh is already done once
+# QUIET_FULL_INTERVAL seconds have passed.
+FULL_INTERVAL = 24 * 60 * 60
+QUIET_FULL_INTERVAL = 12 * 60 * 60
+QUIET_HOURS = range(3, 5)
+# Number of (face, size) fonts kept loaded by the font registry.
+FONT_CACHE_SIZE = 16
+# File keeping the busy durations the driver measured across restarts, so
+# the first refreshes after a start are already planned with them.
+CALIBRATION_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'calibration.json')
 
 class DisplayMode(Enum):
     # Multiple Display Refreshes
@@ -33,21 +67,296 @@ class DisplayMode(Enum):
     # Refreshes a region on the display as is the case for updating the UI.        
     PARTIAL = 2
 
-# FIXME: Remove once font dictionaries are stored in the UI state
-ImageDraw.ImageDraw.font = ImageFont.truetype(os.path.join(picdir, 'Font.ttc'), 24)
+class FontRegistry:
+    # Font files are read once and named after their file name without
+    # extension, e.g. "FiraMono-Regular". Loaded fonts are cached per
+    # (face, size) and the least recently used one is dropped once more than
+    # `capacity` are loaded.
+    def __init__(self, paths: list[str], capacity: int = FONT_CACHE_SIZE):
+        self.faces: dict[str, bytes] = dict()
+        self.fonts: OrderedDict[(str, int), ImageFont.FreeTypeFont] = OrderedDict()
+        self.capacity = capacity
+
+        for path in paths:
+            (face, _) = os.path.splitext(os.path.basename(path))
+            with open(path, 'rb') as file:
+                self.faces[face] = file.read()
+
+    @classmethod
+    def load(cls) -> 'FontRegistry':
+        paths = [os.path.join(fontdir, name) for name in sorted(os.listdir(fontdir)) if name.endswith(('.ttf', '.ttc', '.otf'))]
+        if os.path.exists(os.path.join(picdir, 'Font.ttc')):
+            paths.append(os.path.join(picdir, 'Font.ttc'))
+        return cls(paths)
+
+    def get(self, face: str, size: int) -> ImageFont.FreeTypeFont:
+        key = (face, size)
+        font = self.fonts.get(key)
+
+        if font != None:
+            self.fonts.move_to_end(key)
+            return font
+
+        font = ImageFont.truetype(BytesIO(self.faces[face]), size)
+        self.fonts[key] = font
+        if len(self.fonts) > self.capacity:
+            self.fonts.popitem(last=False)
+        return font
+
+class Glyph(NamedTuple):
+    # The glyph as ImageDraw.text draws it on its own: its 1-bit mask (None if
+    # it has no ink) and the mask's box relative to the "la" anchor.
+    mask: Optional[Image]
+    left: int
+    top: int
+    bottom: int
+    advance: float
+    # FreeType places a string by the grid-fitted outline box of its glyphs,
+    # but draws every glyph at its rounded bitmap origin, and the two can be
+    # a pixel apart. `above` is the top of the outline box over the baseline,
+    # the offsets are how far the bitmap is off that box (vertically, relative
+    # to GlyphAtlas.REFERENCE) and `raised` whether any of the bitmap is above
+    # the baseline.
+    above: int
+    offset_x: int
+    offset_y: int
+    raised: bool
+
+class GlyphAtlas:
+    # Caches the 1-bit bitmap, offset and advance of every glyph drawn so far,
+    # as well as the kerning of every glyph pair, per font. Text is composed
+    # by pasting the cached glyphs instead of rasterizing it with FreeType,
+    # pixel for pixel as ImageDraw.text would draw it.
+
+    # Glyph the vertical bitmap offsets are measured against
+    REFERENCE = 'H'
+
+    def __init__(self):
+        self.glyphs: dict[(Any, int, str), Glyph] = dict()
+        self.kerning: dict[(Any, int, str, str), float] = dict()
+
+    def glyph(self, font: ImageFont.FreeTypeFont, char: str) -> Glyph:
+        key = (font.getname(), font.size, char)
+        glyph = self.glyphs.get(key)
+
+        if glyph == None:
+            (left, top, right, bottom) = font.getbbox(char, mode='1')
+            mask = None
+            if right > left and bottom > top:
+                mask = Image.new('1', (right - left, bottom - top), 0)
+                ImageDraw.Draw(mask).text((-left, -top), char, font=font, fill=1)
+                if mask.getbbox() == None:
+                    mask = None
+            glyph = Glyph(mask, left, top, bottom, font.getlength(char, mode='1'),
+                          -font.getbbox(char, mode='1', anchor='ls')[1], 0, 0, False)
+            if mask != None:
+                glyph = self.place(font, char, glyph)
+            self.glyphs[key] = glyph
+
+        return glyph
+
+    def place(self, font: ImageFont.FreeTypeFont, char: str, glyph: Glyph) -> Glyph:
+        # Draws the glyph behind a few spaces and behind the reference glyph,
+        # and measures how far it moved from where it is drawn on its own.
+        # Spaces have a one pixel bitmap above the baseline, but no ink.
+        (ink_x, ink_y, _, _) = glyph.mask.getbbox()
+        alone = (glyph.left + ink_x, glyph.top + ink_y)
+        pad = ' ' * (2 + int(-glyph.left / font.getlength(' ', mode='1')))
+
+        # Behind spaces, a glyph with none of its bitmap above the baseline is
+        # moved down a pixel, and may be clipped off entirely
+        (x, moved) = self.probe(font, pad, char, glyph.left, alone)
+        raised = moved != None and moved[1] == 0
+
+        if char == self.REFERENCE:
+            return glyph._replace(offset_x=moved[0] - x, raised=raised)
+
+        reference = self.glyph(font, self.REFERENCE)
+        if reference.mask == None:
+            return glyph._replace(raised=raised)
+        (reference_x, reference_y, _, _) = reference.mask.getbbox()
+        (x, moved) = self.probe(font, self.REFERENCE + pad, char, glyph.left,
+                                (reference.left + reference_x, reference.top + reference_y), alone)
+        if moved == None:
+            return glyph._replace(raised=raised)
+        ((reference_moved_x, reference_moved_y), (moved_x, moved_y)) = moved
+        return glyph._replace(offset_x=moved_x - x - reference_moved_x + reference.offset_x,
+                              offset_y=reference_moved_y - moved_y, raised=raised)
+
+    def probe(self, font: ImageFont.FreeTypeFont, prefix: str, char: str, char_left: int, *alone: (int, int)):
+        # Draws prefix + char and returns the pen position of char and how far
+        # the ink of the prefix (if `alone` gives two positions, the last one
+        # being char's) and of char moved from their `alone` positions, or
+        # None if any of it is clipped. char's ink starts at char_left.
+        (left, top, right, bottom) = font.getbbox(prefix + char, mode='1')
+        image = Image.new('1', (right - left, bottom - top), 0)
+        ImageDraw.Draw(image).text((-left, -top), prefix + char, font=font, fill=1)
+        x = int(font.getlength(prefix + char, mode='1') - font.getlength(char, mode='1') + 0.5)
+
+        split = x + char_left - left if len(alone) > 1 else 0
+        parts = [(0, split), (split, image.width)][-len(alone):]
+        moved = []
+        for ((x0, x1), (alone_x, alone_y)) in zip(parts, alone):
+            ink = image.crop((x0, 0, x1, image.height)).getbbox()
+            if ink == None:
+                return (x, None)
+            moved.append((x0 + ink[0] + left - alone_x, ink[1] + top - alone_y))
+        return (x, moved[0] if len(moved) == 1 else tuple(moved))
+
+    def kern(self, font: ImageFont.FreeTypeFont, a: str, b: str) -> float:
+        key = (font.getname(), font.size, a, b)
+        kerning = self.kerning.get(key)
+
+        if kerning == None:
+            kerning = font.getlength(a + b, mode='1') - font.getlength(a, mode='1') - font.getlength(b, mode='1')
+            self.kerning[key] = kerning
+
+        return kerning
+
+    def text(self, image: Image, xy: (int, int), text: str, font: ImageFont.FreeTypeFont, fill: int, spacing: int = 4):
+        # Same layout as ImageDraw.text with the default "la" anchor.
+        (x, y) = xy
+        line_height = font.getbbox('A', mode='1')[3] + spacing
+        (ascent, _) = font.getmetrics()
+
+        for line in text.split('\n'):
+            pen = 0.0
+            previous = None
+            placed = []
+            spaced = False
+            for char in line:
+                if previous != None:
+                    pen += self.kern(font, previous, char)
+                glyph = self.glyph(font, char)
+                if glyph.mask != None:
+                    placed.append((int(pen + 0.5), glyph))
+                else:
+                    spaced = True
+                pen += glyph.advance
+                previous = char
+
+            if len(placed) > 0:
+                # The line's outline box against its bitmap box: the glyphs
+                # are moved by how far the two are apart, and clipped to the
+                # outline box
+                above = max(glyph.above for (_, glyph) in placed)
+                if spaced and not any(glyph.raised for (_, glyph) in placed):
+                    shift = lambda glyph: glyph.above - above + 1
+                else:
+                    bitmap_above = max(glyph.above + glyph.offset_y for (_, glyph) in placed)
+                    shift = lambda glyph: bitmap_above - above - glyph.offset_y
+                left = min([0] + [position + glyph.left for (position, glyph) in placed])
+                bitmap_left = min([0] + [position + glyph.left + glyph.offset_x for (position, glyph) in placed])
+                bottom = y + max([ascent] + [glyph.bottom for (_, glyph) in placed])
+
+                for (position, glyph) in placed:
+                    (glyph_x, glyph_y) = (x + left - bitmap_left + position + glyph.left + glyph.offset_x, y + glyph.top + shift(glyph))
+                    mask = glyph.mask
+                    if glyph_y + mask.height > bottom:
+                        if glyph_y >= bottom:
+                            continue
+                        mask = mask.crop((0, 0, mask.width, bottom - glyph_y))
+                    image.paste(fill, (glyph_x, glyph_y), mask)
+            y += line_height
+
+# Translation table flipping every bit of a byte, used with `bytes.translate`
+# to convert between PIL polarity (1=white) and panel polarity (1=black).
+INVERT = bytes(range(0xFF, -1, -1))
+
+class Framebuffer:
+    # A mode "1" image together with its packed panel-polarity copy. The
+    # packed buffer is kept up to date row by row as regions are drawn, so a
+    # refresh never has to convert the whole image in Python.
+    def __init__(self, image: Image):
+        self.image = image
+        self.stride = (image.width + 7) // 8
+        self.buffer = bytearray(image.tobytes().translate(INVERT))
+
+    def draw(self, x: int, y: int, image: Image):
+        self.image.paste(image, (x, y))
+        self.sync(y, image.height)
+
+    def draw_changes(self, x: int, y: int, image: Image) -> Optional[tuple[int, int, int, int]]:
+        # Draws the image and returns the byte-aligned region of pixels that
+        # actually changed, or None if the image was already on display.
+        image = image.crop((0, 0, min(image.width, self.image.width - x), min(image.height, self.image.height - y)))
+        previous = self.image.crop((x, y, x + image.width, y + image.height))
+        bbox = ImageChops.logical_xor(previous, image).getbbox()
+
+        if bbox == None:
+            return None
+
+        self.draw(x, y, image)
+
+        (left, top, right, bottom) = bbox
+        x0 = (x + left) // 8 * 8
+        x1 = min((x + right + 7) // 8 * 8, self.image.width)
+        return (x0, y + top, x1 - x0, bottom - top)
+
+    def sync(self, y: int, height: int):
+        rows = self.image.crop((0, y, self.image.width, y + height))
+        self.buffer[y * self.stride:(y + height) * self.stride] = rows.tobytes().translate(INVERT)
+
+    def window(self, x: int, y: int, width: int, height: int) -> bytearray:
+        # Packed rows of the byte-aligned window covering the given region.
+        # The packed buffer already is in panel polarity, so each row is a
+        # single slice copy.
+        x0 = x // 8
+        x1 = (x + width + 7) // 8
+        scan_width = x1 - x0
+
+        source = memoryview(self.buffer)
+        window = bytearray(scan_width * height)
+        target = memoryview(window)
+
+        offset = y * self.stride + x0
+        for i in range(0, height * scan_width, scan_width):
+            target[i:i + scan_width] = source[offset:offset + scan_width]
+            offset += self.stride
+
+        return window
+
+    def planes(self) -> (bytes, bytes):
+        # The new data plane in panel polarity and its inverse, which is
+        # exactly the image in PIL polarity.
+        return (bytes(self.buffer), self.image.tobytes())
 
 class Display(NamedTuple):
+    # The EPD is only ever touched from the single thread of `worker`, so its
+    # blocking SPI transfers and busy waits never stall the event loop.
     epd: epd7in5_V2.EPD
-    image: Image
-
-    def set_mode(self, mode: DisplayMode):
+    framebuffer: Framebuffer
+    worker: ThreadPoolExecutor
+
+    @property
+    def image(self) -> Image:
+        return self.framebuffer.image
+
+    async def run(self, function, *args) -> Any:
+        # The driver already retried a hung refresh once after a reset; if
+        # that hangs too, the frame is dropped instead of the UI loop.
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.worker, function, *args)
+        except epdconfig.BusyTimeout as e:
+            logging.error("Display not responding, dropped %s: %s", function.__name__, e)
+            # the panel takes nothing else before it is initialised again
+            if function != self.epd.reinit:
+                await self.run(self.epd.reinit)
+
+    def refresh_time(self, mode: DisplayMode) -> float:
+        # Seconds the panel stays busy for a refresh in `mode`, as measured
+        # by the driver, or REFRESH_COST before the first one.
+        predicted = epdcalibration.calibration.predict(self.epd, mode.name.lower())
+        return REFRESH_COST if predicted == None else predicted
+
+    async def set_mode(self, mode: DisplayMode):
         match mode:
             case DisplayMode.FULL:
-                self.epd.init()
+                await self.run(self.epd.init)
             case DisplayMode.FAST:
-                self.epd.init_fast()
+                await self.run(self.epd.init_fast)
             case DisplayMode.PARTIAL:
-                self.epd.init_part()
+                await self.run(self.epd.init_part)
             case _:
                 pass
 
@@ -55,43 +364,149 @@ class Display(NamedTuple):
         return self.image.crop((x, y, x + width, y + height))
 
     def draw(self, x: int, y: int, image: Image):
-        self.image.paste(image, (x, y))
+        self.framebuffer.draw(x, y, image)
 
-    def display(self):
-        buffer = bytearray(self.image.tobytes())
+    async def display(self):
+        # Both planes are copies, so drawing may continue during the refresh.
+        (buffer, inverted) = self.framebuffer.planes()
+        await self.run(self.epd.display, buffer, inverted)
+        logging.debug("Frame refresh sent %d bytes", self.epd.frame_bytes)
 
-        for i in range(0, len(buffer)):
-            buffer[i] ^= 0xFF
-            
-        self.epd.display(buffer)
+    async def display_partial(self, x: int, y: int, width: int, height: int):
+        buffer = self.framebuffer.window(x, y, width, height)
+        await self.run(self.epd.display_Partial, buffer, x, y, x + width, y + height)
 
-    def display_partial(self, x: int, y: int, width: int, height: int):
-        bytes = self.image.tobytes()
+    async def clear(self):
+        await self.run(self.epd.Clear)
 
-        x0 = x // 8
-        x1 = (x + width + 7) // 8
-        y0 = y
-        y1 = y + height
-        scan_width = x1 - x0
+def load_calibration():
+    epdcalibration.calibration.path = CALIBRATION_PATH
+    epdcalibration.calibration.load()
+
+def save_calibration():
+    try:
+        epdcalibration.calibration.save()
+    except OSError as e:
+        logging.warning("Could not save the busy calibration: %s", e)
 
-        buffer = bytearray(scan_width * height)
+Region = tuple[int, int, int, int]
 
-        for i in range(0, height):
-            for j in range(0, scan_width):
-                image_pos = (y0 + i) * (self.epd.width // 8) + (x0 + j)
-                buffer_pos = i * scan_width + j
-                buffer[buffer_pos] = bytes[image_pos] ^ 0xFF
+def region_cost(region: Region, refresh_cost: float = REFRESH_COST) -> float:
+    (x, y, width, height) = region
+    scan_width = (x + width + 7) // 8 - x // 8
+    return refresh_cost + scan_width * height * BYTE_COST
 
-        self.epd.display_Partial(buffer, x, y0, x + width, y1)
+def region_union(a: Region, b: Region) -> Region:
+    x0 = min(a[0], b[0])
+    y0 = min(a[1], b[1])
+    x1 = max(a[0] + a[2], b[0] + b[2])
+    y1 = max(a[1] + a[3], b[1] + b[3])
+    return (x0, y0, x1 - x0, y1 - y0)
 
-    def clear(self):
-        self.epd.Clear()
+@dataclass(slots=True)
+class DirtyRegions:
+    # Collects changed display regions for `delay` seconds after the first
+    # change and merges them into the cheapest set of partial refreshes.
+    delay: float = COALESCE_DELAY
+    # Fixed seconds per partial refresh, see Display.refresh_time.
+    refresh_cost: float = REFRESH_COST
+    regions: list[Region] = field(default_factory=list)
+    since: Optional[float] = None
+    # Number of regions marked dirty and number of refreshes issued for them.
+    marked: int = 0
+    refreshed: int = 0
+
+    def add(self, x: int, y: int, width: int, height: int):
+        if self.since == None:
+            self.since = time.monotonic()
+        self.regions.append((x, y, width, height))
+        self.marked += 1
+
+    def timeout(self) -> Optional[float]:
+        if self.since == None:
+            return None
+        return max(0.0, self.since + self.delay - time.monotonic())
+
+    def take(self) -> list[Region]:
+        regions = self.regions
+        refresh_cost = self.refresh_cost
+
+        # Greedily merge the pair with the largest saving until merging no
+        # longer pays off. The number of regions is tiny, so O(n^3) is fine.
+        while len(regions) > 1:
+            best = None
+            for i in range(0, len(regions)):
+                for j in range(i + 1, len(regions)):
+                    union = region_union(regions[i], regions[j])
+                    saving = (region_cost(regions[i], refresh_cost) + region_cost(regions[j], refresh_cost)
+                              - region_cost(union, refresh_cost))
+                    if saving >= 0 and (best == None or saving > best[0]):
+                        best = (saving, i, j, union)
+
+            if best == None:
+                break
+
+            (_, i, j, union) = best
+            regions = [r for (k, r) in enumerate(regions) if k != i and k != j] + [union]
+
+        self.regions = []
+        self.since = None
+        self.refreshed += len(regions)
+        return regions
+
+    @property
+    def saved(self) -> int:
+        return self.marked - self.refreshed
+
+@dataclass(slots=True)
+class RefreshPolicy:
+    # Tracks the partial refreshes each tile received and the time since the
+    # last full refresh to plan cleanup refreshes for idle periods. Merged
+    # and tightly cropped regions differ from refresh to refresh, so every
+    # tile a region overlaps is counted instead of the region itself.
+    partial: dict[(int, int), int] = field(default_factory=dict)
+    last_full: float = field(default_factory=time.monotonic)
+
+    def record(self, mode: DisplayMode, region: Optional[Region] = None):
+        match mode:
+            case DisplayMode.FULL:
+                self.partial.clear()
+                self.last_full = time.monotonic()
+            case DisplayMode.FAST:
+                self.partial.clear()
+            case DisplayMode.PARTIAL:
+                (x, y, width, height) = region
+                for row in range(y // REFRESH_TILE, (y + height - 1) // REFRESH_TILE + 1):
+                    for column in range(x // REFRESH_TILE, (x + width - 1) // REFRESH_TILE + 1):
+                        self.partial[(column, row)] = self.partial.get((column, row), 0) + 1
+
+    def cleanup(self) -> Optional[DisplayMode]:
+        elapsed = time.monotonic() - self.last_full
+
+        if elapsed >= FULL_INTERVAL:
+            return DisplayMode.FULL
+        if time.localtime().tm_hour in QUIET_HOURS and elapsed >= QUIET_FULL_INTERVAL:
+            return DisplayMode.FULL
+        if any(count >= MAX_PARTIAL_REFRESHES for count in self.partial.values()):
+            return DisplayMode.FAST
+        return None
+
+class RenderCtx(NamedTuple):
+    image: Image
+    draw: ImageDraw.ImageDraw
+    fonts: FontRegistry
+    glyphs: GlyphAtlas
+
+    def text(self, xy: (int, int), text: str, font: ImageFont.FreeTypeFont, fill: int):
+        self.glyphs.text(self.image, xy, text, font, fill)
 
 class EventKind(Enum):
     ADDED = 0
     UPDATE = 1
     TASK = 2
     REMOVED = 3
+    # Periodic timers fired, `Event.data` lists the widgets they belong to.
+    TICK = 4
 
 class Event(NamedTuple):
     kind: EventKind
@@ -102,10 +517,58 @@ class Message(NamedTuple):
     kind: EventKind
     data: Any
 
+class TimerService:
+    # Periodic widget timers kept in a single heap. Deadlines are multiples of
+    # the period in local wall-clock time, e.g. every minute at :00, and are
+    # always derived from the clock, so processing latency never accumulates.
+    # Timers due at the same time are delivered together in one TICK event.
+    def __init__(self, event_queue: asyncio.Queue):
+        self.event_queue = event_queue
+        self.timers: list[(float, int, float)] = []
+        self.changed = asyncio.Event()
+
+    @staticmethod
+    def next_deadline(now: float, period: float) -> float:
+        offset = time.localtime(now).tm_gmtoff
+        return (math.floor((now + offset) / period) + 1) * period - offset
+
+    def every(self, widget_id: int, period: float):
+        heapq.heappush(self.timers, (self.next_deadline(time.time(), period), widget_id, period))
+        self.changed.set()
+
+    def cancel(self, widget_id: int):
+        self.timers = [timer for timer in self.timers if timer[1] != widget_id]
+        heapq.heapify(self.timers)
+        self.changed.set()
+
+    async def run(self):
+        while True:
+            self.changed.clear()
+            now = time.time()
+
+            if len(self.timers) == 0 or self.timers[0][0] > now:
+                timeout = None if len(self.timers) == 0 else self.timers[0][0] - now
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due = []
+            while len(self.timers) > 0 and self.timers[0][0] <= now:
+                (_, widget_id, period) = heapq.heappop(self.timers)
+                due.append((widget_id, period))
+
+            for (widget_id, period) in due:
+                heapq.heappush(self.timers, (self.next_deadline(now, period), widget_id, period))
+
+            await self.event_queue.put(Event(kind=EventKind.TICK, target=None, data=[widget_id for (widget_id, _) in due]))
+
 @dataclass(slots=True)
 class EventCtx:
     event_queue: asyncio.Queue
     scheduled_tasks: dict[(int, int), asyncio.Task[Any]]
+    timers: TimerService
     widget_id: Optional[int] = None
     task_id: int = 0
     changed: bool = False
@@ -123,6 +586,9 @@ class EventCtx:
         self.scheduled_tasks[(self.widget_id, task_id)] = task
         self.task_id = task_id + 1
 
+    def schedule_periodic(self, period: float):
+        self.timers.every(self.widget_id, period)
+
 
 @dataclass(slots=True)
 class Greeter:
@@ -137,33 +603,48 @@ class Greeter:
             case _:
                 pass
 
-    def view(self, ctx: ImageDraw, size: (int, int)):
+    def view(self, ctx: RenderCtx, size: (int, int)):
         (width, height) = size
-        ctx.rectangle((0, 0, width, height), fill = 255)
-        ctx.text((0, 0), f"Hallo {self.name}!", font_size = 24, fill = 0)
+        ctx.draw.rectangle((0, 0, width, height), fill = 255)
+        ctx.text((0, 0), f"Hallo {self.name}!", font = ctx.fonts.get('Font', 24), fill = 0)
 
 
 @dataclass(slots=True)
 class Clock:
     def update(self, ctx: EventCtx, message: Message):
         match message.kind:
-            case EventKind.ADDED | EventKind.TASK:
+            case EventKind.ADDED:
+                ctx.mark_changed()
+                ctx.schedule_periodic(60)
+            case EventKind.TICK:
                 ctx.mark_changed()
-                ctx.spawn_task(asyncio.sleep(60 - min(time.localtime().tm_sec, 60)))
             case _:
                 pass
 
-    def view(self, ctx: ImageDraw, size: (int, int)):
+    def view(self, ctx: RenderCtx, size: (int, int)):
         (width, height) = size
-        ctx.rectangle((0, 0, width, height), fill = 255)
-        font = ImageFont.truetype('../fonts/FiraMono-Regular.ttf', 24)
+        ctx.draw.rectangle((0, 0, width, height), fill = 255)
+        font = ctx.fonts.get('FiraMono-Regular', 24)
         ctx.text((5, 5), time.strftime('%H:%M // %A, %d.%m.%y'), font = font, fill = 0)
 
-async def ui_handler(event_queue: asyncio.Queue):
-    display = Display(epd=epd7in5_V2.EPD(), image=Image.new("1", (800, 480), 255))
-    display.set_mode(DisplayMode.FULL)
+def latest_updates(events: list[Event]) -> list[Event]:
+    # Only the latest update of each widget matters, all other events are
+    # kept in their original order.
+    latest = dict((event.target, i) for (i, event) in enumerate(events) if event.kind == EventKind.UPDATE)
+    return [event for (i, event) in enumerate(events) if event.kind != EventKind.UPDATE or latest[event.target] == i]
 
-    ctx = EventCtx(event_queue=event_queue, scheduled_tasks=dict())
+async def ui_handler(event_queue: asyncio.Queue):
+    framebuffer = Framebuffer(Image.new("1", (800, 480), 255))
+    worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="epd")
+    display = Display(epd=epd7in5_V2.EPD(), framebuffer=framebuffer, worker=worker)
+    load_calibration()
+    await display.set_mode(DisplayMode.FULL)
+
+    fonts = FontRegistry.load()
+    glyphs = GlyphAtlas()
+    timers = TimerService(event_queue)
+    timer_task = asyncio.create_task(timers.run())
+    ctx = EventCtx(event_queue=event_queue, scheduled_tasks=dict(), timers=timers)
     widgets: dict[int, (Any, (int, int, int, int))] = dict([
         (0, (Clock(), (0, 0, 800, 160))),
         (1, (Greeter(), (0, 160, 800, 320)))
@@ -175,48 +656,95 @@ async def ui_handler(event_queue: asyncio.Queue):
         widget.update(ctx, message)
         image = display.slice(x, y, width, height)
 
-        widget.view(ImageDraw.Draw(image), (width, height))
+        widget.view(RenderCtx(image=image, draw=ImageDraw.Draw(image), fonts=fonts, glyphs=glyphs), (width, height))
         display.draw(x, y, image)
 
-    display.display()
+    await display.display()
 
-    display.set_mode(DisplayMode.PARTIAL)
+    await display.set_mode(DisplayMode.PARTIAL)
     ctx.widget_id = None
     ctx.changed = False
 
+    dirty = DirtyRegions()
+    policy = RefreshPolicy()
+
     while True:
-        event = await event_queue.get()
+        timeout = dirty.timeout()
+
+        try:
+            event = await asyncio.wait_for(event_queue.get(), IDLE_DELAY if timeout == None else timeout)
+        except asyncio.TimeoutError:
+            if timeout != None:
+                dirty.refresh_cost = display.refresh_time(DisplayMode.PARTIAL)
+                for region in dirty.take():
+                    await display.display_partial(*region)
+                    policy.record(DisplayMode.PARTIAL, region)
+                logging.debug("Refreshed %d of %d dirty regions (%d saved, %d busy timeouts)",
+                              dirty.refreshed, dirty.marked, dirty.saved, display.epd.busy_timeouts)
+                continue
+
+            # Cleanup refreshes only happen while idle, so they never delay
+            # an update somebody is waiting for.
+            mode = policy.cleanup()
+            if mode != None:
+                logging.debug("Idle cleanup with %s refresh", mode.name)
+                await display.set_mode(mode)
+                await display.display()
+                await display.set_mode(DisplayMode.PARTIAL)
+                policy.record(mode)
+                # on the worker, so no refresh records while it is written
+                await display.run(save_calibration)
+            continue
 
-        match event.kind:
-            case EventKind.ADDED:
-                # TODO: Dynamically add widgets.
-                pass
-            case EventKind.REMOVED:
-                # TODO: Widgets currently make no use of as data is stored in
-                # memory. In the future it should be used to clean up
-                # resources like files.
-                pass
-            case EventKind.TASK:
-                del ctx.scheduled_tasks[(event.target, event.data[0])]
-                
-        value = widgets.get(event.target)
+        # Apply every event that is already waiting before rendering, so a
+        # burst of events costs a single render per widget.
+        events = [event]
+        while not event_queue.empty():
+            events.append(event_queue.get_nowait())
 
-        if value == None:
-            continue
+        changed = set()
 
-        (widget, (x, y, width, height)) = value
-        message = Message(kind=event.kind, data=event.data)
-        ctx.widget_id = event.target
-        widget.update(ctx, message)
+        for event in latest_updates(events):
+            match event.kind:
+                case EventKind.ADDED:
+                    # TODO: Dynamically add widgets.
+                    pass
+                case EventKind.REMOVED:
+                    # TODO: Widgets currently make no use of as data is stored in
+                    # memory. In the future it should be used to clean up
+                    # resources like files.
+                    pass
+                case EventKind.TASK:
+                    del ctx.scheduled_tasks[(event.target, event.data[0])]
+
+            targets = event.data if event.kind == EventKind.TICK else [event.target]
+            message = Message(kind=event.kind, data=None if event.kind == EventKind.TICK else event.data)
+
+            for target in targets:
+                value = widgets.get(target)
+
+                if value == None:
+                    continue
+
+                (widget, _) = value
+                ctx.widget_id = target
+                widget.update(ctx, message)
+
+                if ctx.changed:
+                    changed.add(target)
+
+                ctx.widget_id = None
+                ctx.changed = False
 
-        if ctx.changed:
+        for widget_id in changed:
+            (widget, (x, y, width, height)) = widgets[widget_id]
             image = display.slice(x, y, width, height)
-            widget.view(ImageDraw.Draw(image), (width, height))
-            display.draw(x, y, image)
-            display.display_partial(x, y, width, height)
+            widget.view(RenderCtx(image=image, draw=ImageDraw.Draw(image), fonts=fonts, glyphs=glyphs), (width, height))
 
-        ctx.widget_id = None
-        ctx.changed = False
+            # Only refresh the pixels that changed, if any.
+            region = display.framebuffer.draw_changes(x, y, image)
+            if region != None:
+                dirty.add(*region)
 
 
 async def web_server(event_queue: asyncio):
@@ -240,12 +768,16 @@ async def web_server(event_queue: asyncio):
     await asyncio.Event().wait()
 
 async def main():
-    event_queue = asyncio.Queue(maxsize=2)
+    event_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
 
     ui_task = asyncio.create_task(ui_handler(event_queue))
     server_task = asyncio.create_task(web_server(event_queue))
 
-    await server_task
-    await ui_task
+    try:
+        await server_task
+        await ui_task
+    finally:
+        save_calibration()
 
-asyncio.run(main())
+if __name__ == "__main__":
+    asyncio.run(main())
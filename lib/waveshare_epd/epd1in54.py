@@ -81,6 +81,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 200
@@ -134,8 +136,8 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)
+        if not epdconfig.busy_wait(0, epdcalibration.DEFAULT_TIMEOUT):      # 0: idle, 1: busy
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         logger.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
@@ -203,26 +205,7 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def display(self, image):
         if (image == None):
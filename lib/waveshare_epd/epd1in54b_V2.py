@@ -29,6 +29,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 200
@@ -76,8 +78,8 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):
-            epdconfig.delay_ms(100)    
+        if not epdconfig.busy_wait(0, epdcalibration.DEFAULT_TIMEOUT):
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         logger.debug("e-Paper busy release")
         
     def init(self):
@@ -123,7 +125,6 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        buf = [0xFF] * int(self.width * self.height / 8)
         # Set buffer to value of Python Imaging Library image.
         # Image must be in mode 1.
         image_monocolor = image.convert('1')
@@ -132,23 +133,10 @@ class EPD:
             raise ValueError('Image must be same dimensions as display \
                 ({0}x{1}).' .format(self.width, self.height))
 
-        pixels = image_monocolor.load()
-        for y in range(self.height):
-            for x in range(self.width):
-                # Set the bits for the column of pixels at the current position.
-                if pixels[x, y] == 0:
-                    buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        return buf
+        return epdbuffer.getbuffer(image_monocolor, self.width, self.height)
 
     def display(self, blackimage, redimage):
 
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-
-        buf = [0x00] * self.height * linewidth
-
         # send black data
         if (blackimage != None):
             self.send_command(0x24) # DATA_START_TRANSMISSION_1
@@ -157,9 +145,7 @@ class EPD:
         # send red data        
         if (redimage != None):
             self.send_command(0x26) # DATA_START_TRANSMISSION_2
-            for i in range(0, int(self.width * self.height / 8)):
-                buf[i] = ~redimage[i]
-            self.send_data2(buf)
+            self.send_data2(bytes(redimage[:int(self.width * self.height / 8)]).translate(epdbuffer.INVERT))
 
         self.send_command(0x22) # DISPLAY_REFRESH
         self.send_data(0xF7)
@@ -173,10 +159,10 @@ class EPD:
             linewidth = int(self.width/8) + 1
 
         self.send_command(0x24) # DATA_START_TRANSMISSION_1
-        self.send_data2([0xff] * int(self.height * linewidth))
+        self.send_data2(epdbuffer.fill(0xff, int(self.height * linewidth)))
             
         self.send_command(0x26) # DATA_START_TRANSMISSION_2
-        self.send_data2([0x00] * int(self.height * linewidth))
+        self.send_data2(epdbuffer.fill(0x00, int(self.height * linewidth)))
 
         self.send_command(0x22) # DISPLAY_REFRESH
         self.send_data(0xF7)
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -82,8 +83,8 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):        
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)            
+        if not epdconfig.busy_wait(0, epdcalibration.DEFAULT_TIMEOUT):      # 0: idle, 1: busy
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
 
     def TurnOnDisplay(self):
         self.send_command(0x22) # DISPLAY_UPDATE_CONTROL_2
@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -113,8 +115,8 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)    
+        if not epdconfig.busy_wait(0, epdcalibration.DEFAULT_TIMEOUT):      # 0: idle, 1: busy
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
 
     def TurnOnDisplay(self):
         self.send_command(0x22)
@@ -259,10 +261,7 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
 
-        buf = [0x00] * self.height * linewidth
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                buf[i + j * linewidth] = ~image[i + j * linewidth]
+        buf = bytes(image[:self.height * linewidth]).translate(epdbuffer.INVERT)
 
         self.send_command(0x24)
         self.send_data2(image)   
@@ -287,13 +286,8 @@ class EPD:
             linewidth = int(self.width/8) + 1
         # logger.debug(linewidth)
         
-        buf = [0x00] * self.height * linewidth
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                buf[i + j * linewidth] = color
-
         self.send_command(0x24)
-        self.send_data2(buf)
+        self.send_data2(epdbuffer.fill(color, self.height * linewidth))
                 
         # self.send_command(0x26)
         # for j in range(0, self.height):
@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -137,8 +139,8 @@ class EPD:
     '''
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(10)  
+        if not epdconfig.busy_wait(0, epdcalibration.DEFAULT_TIMEOUT):      # 0: idle, 1: busy
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         logger.debug("e-Paper busy release")
 
     '''
@@ -369,7 +371,7 @@ class EPD:
         # logger.debug(linewidth)
         
         self.send_command(0x24)
-        self.send_data2([color] * int(self.height * linewidth))  
+        self.send_data2(epdbuffer.fill(color, int(self.height * linewidth)))  
         self.TurnOnDisplay()
 
     '''
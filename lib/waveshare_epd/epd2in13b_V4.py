@@ -29,6 +29,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -78,8 +80,8 @@ class EPD:
     # judge e-Paper whether is busy
     def busy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) != 0): 
-            epdconfig.delay_ms(10)
+        if not epdconfig.busy_wait(0, epdcalibration.DEFAULT_TIMEOUT):
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         logger.debug("e-Paper busy release")
 
     # set the display window
@@ -178,7 +180,7 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
             
-        buf = [0xff] * (int(linewidth * self.height))
+        buf = epdbuffer.fill(0xff, int(linewidth * self.height))
             
         self.send_command(0x24)
         self.send_data2(buf)
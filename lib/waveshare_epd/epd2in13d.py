@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 from PIL import Image
 import RPi.GPIO as GPIO
 
@@ -177,12 +179,20 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte2(data)
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # a command and its parameters in one transaction
+    def send_command_data(self, command, data):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
     
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            self.send_command(0x71)
-            epdconfig.delay_ms(100)  
+        if not epdconfig.busy_poll(1, epdcalibration.DEFAULT_TIMEOUT, lambda: self.send_command(0x71)):      # 0: idle, 1: busy
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         logger.debug("e-Paper busy release")
         
     def TurnOnDisplay(self):
@@ -262,28 +272,7 @@ class EPD:
         self.send_data2(self.lut_bb1)
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def display(self, image):
         if (Image == None):
@@ -295,7 +284,7 @@ class EPD:
             linewidth = int(self.width/8) + 1
 
         self.send_command(0x10)
-        self.send_data2([0x00] * self.height * linewidth)
+        self.send_data2(epdbuffer.fill(0x00, self.height * linewidth))
         epdconfig.delay_ms(10)
         
         self.send_command(0x13)
@@ -310,25 +299,17 @@ class EPD:
             return
             
         self.send_command(0x91)
-        self.send_command(0x90)
-        self.send_data(0)
-        self.send_data(self.width - 1)
-
-        self.send_data(0)
-        self.send_data(0)
-        self.send_data(int(self.height / 256))
-        self.send_data(self.height % 256 - 1)
-        self.send_data(0x28)
+        self.send_command_data(0x90, [
+            0, self.width - 1,
+            0, 0, int(self.height / 256), self.height % 256 - 1,
+            0x28])
         
         if self.width%8 == 0:
             linewidth = int(self.width/8)
         else:
             linewidth = int(self.width/8) + 1
 
-        buf = [0x00] * self.height * linewidth
-
-        for i in range(self.height * linewidth):
-            buf[i] = ~image[i]
+        buf = bytes(image[:self.height * linewidth]).translate(epdbuffer.INVERT)
         
         self.send_command(0x10)
         self.send_data2(image)
@@ -348,11 +329,11 @@ class EPD:
             linewidth = int(self.width/8) + 1
 
         self.send_command(0x10)
-        self.send_data2([0x00] * self.height * linewidth)
+        self.send_data2(epdbuffer.fill(0x00, self.height * linewidth))
         epdconfig.delay_ms(10)
         
         self.send_command(0x13)
-        self.send_data2([0xFF] * self.height * linewidth)
+        self.send_data2(epdbuffer.fill(0xFF, self.height * linewidth))
         epdconfig.delay_ms(10)
         
         self.SetFullReg()
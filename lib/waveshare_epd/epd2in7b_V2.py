@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 176
@@ -79,8 +81,8 @@ class EPD:
     # Read Busy
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(10)
+        if not epdconfig.busy_wait(0, epdcalibration.DEFAULT_TIMEOUT):      # 0: idle, 1: busy
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         logger.debug("e-Paper busy release")
             
     # Setting the display window
@@ -127,37 +129,14 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
     
     # Sends the image buffer in RAM to e-Paper and displays
     def display(self, imageblack, imagered):
         Width = self.width / 8 
         Height = self.height 
 
-        buf = [0x00] * int(Width * Height)
-        for i in range(0, int(Width * Height)):
-            buf[i] = ~imagered[i]
+        buf = bytes(imagered[:int(Width * Height)]).translate(epdbuffer.INVERT)
 
         self.send_command(0x24) 
         self.send_data2(imageblack) 
@@ -170,10 +149,10 @@ class EPD:
     # Clear the screen
     def Clear(self):
         self.send_command(0x24)
-        self.send_data2([0xff] * int(self.width * self.height / 8))
+        self.send_data2(epdbuffer.fill(0xff, int(self.width * self.height / 8)))
 
         self.send_command(0x26)
-        self.send_data2([0x00] * int(self.width * self.height / 8))
+        self.send_data2(epdbuffer.fill(0x00, int(self.width * self.height / 8)))
             
         self.TurnOnDisplay()
         
@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 128
@@ -77,8 +79,8 @@ class EPD:
     def ReadBusy(self):
         logger.debug("e-Paper busy")
         self.send_command(0X71)
-        while(epdconfig.digital_read(self.busy_pin) == 1):      #  0: idle, 1: busy
-            epdconfig.delay_ms(200)                
+        if not epdconfig.busy_wait(0, epdcalibration.DEFAULT_TIMEOUT):      #  0: idle, 1: busy
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         logger.debug("e-Paper busy release")
         
 
@@ -211,60 +213,25 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def display(self, blackimage, ryimage): # ryimage: red or yellow image
-        if(self.width % 8 == 0):
-            Width = self.width // 8
-        else:
-            Width = self.width // 8 +1
-        Height = self.height
         if (blackimage != None):
             self.send_command(0x24)
             self.send_data2(blackimage)        
         if (ryimage != None):
-            for j in range(Height):
-                for i in range(Width):
-                    ryimage[i + j * Width] = ~ryimage[i + j * Width]
+            ryimage = bytes(ryimage).translate(epdbuffer.INVERT)
             self.send_command(0x26)
             self.send_data2(ryimage)
 
         self.TurnOnDisplay()
 
     def display_Fast(self, blackimage, ryimage): # ryimage: red or yellow image
-        if(self.width % 8 == 0):
-            Width = self.width // 8
-        else:
-            Width = self.width // 8 +1
-        Height = self.height
         if (blackimage != None):
             self.send_command(0x24)
             self.send_data2(blackimage)        
         if (ryimage != None):
-            for j in range(Height):
-                for i in range(Width):
-                    ryimage[i + j * Width] = ~ryimage[i + j * Width]
+            ryimage = bytes(ryimage).translate(epdbuffer.INVERT)
             self.send_command(0x26)
             self.send_data2(ryimage)
 
@@ -272,42 +239,33 @@ class EPD:
         
     def Clear(self):
         self.send_command(0x24)
-        self.send_data2([0xff] * int(self.width * self.height // 8))
+        self.send_data2(epdbuffer.fill(0xff, int(self.width * self.height // 8)))
         self.send_command(0x26)
-        self.send_data2([0x00] * int(self.width * self.height // 8))
+        self.send_data2(epdbuffer.fill(0x00, int(self.width * self.height // 8)))
 
         self.TurnOnDisplay()
 
     def Clear_Fast(self):
         self.send_command(0x24)
-        self.send_data2([0xff] * int(self.width * self.height // 8))
+        self.send_data2(epdbuffer.fill(0xff, int(self.width * self.height // 8)))
         self.send_command(0x26)
-        self.send_data2([0x00] * int(self.width * self.height // 8))
+        self.send_data2(epdbuffer.fill(0x00, int(self.width * self.height // 8)))
 
         self.TurnOnDisplay_Fast()
 
     def display_Base(self, blackimage, ryimage):
-        if(self.width % 8 == 0):
-            Width = self.width // 8
-        else:
-            Width = self.width // 8 +1
-        Height = self.height
         if (blackimage != None):
             self.send_command(0x24)
             self.send_data2(blackimage)        
         if (ryimage != None):
-            for j in range(Height):
-                for i in range(Width):
-                    ryimage[i + j * Width] = ~ryimage[i + j * Width]
+            ryimage = bytes(ryimage).translate(epdbuffer.INVERT)
             self.send_command(0x26)
             self.send_data2(ryimage)
 
         self.TurnOnDisplay_Base()
 
         if (blackimage != None):
-            for j in range(Height):
-                for i in range(Width):
-                    blackimage[i + j * Width] = ~blackimage[i + j * Width]
+            blackimage = bytes(blackimage).translate(epdbuffer.INVERT)
             self.send_command(0x26)
             self.send_data2(blackimage)
         else:
@@ -33,6 +33,8 @@
 from distutils.command.build_scripts import build_scripts
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 from PIL import Image
 import RPi.GPIO as GPIO
 
@@ -137,12 +139,20 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte2(data)
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # a command and its parameters in one transaction
+    def send_command_data(self, command, data):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            self.send_command(0x71)
-            epdconfig.delay_ms(10)  
+        if not epdconfig.busy_poll(1, epdcalibration.DEFAULT_TIMEOUT, lambda: self.send_command(0x71), 0.01):      # 0: idle, 1: busy
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         logger.debug("e-Paper busy release")
         
     def TurnOnDisplay(self):
@@ -218,32 +228,11 @@ class EPD:
         self.send_data2(self.lut_bb1)
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def display(self, image):
         self.send_command(0x10)
-        self.send_data2([0x00] * int(self.width * self.height / 8))
+        self.send_data2(epdbuffer.fill(0x00, int(self.width * self.height / 8)))
         epdconfig.delay_ms(10)
         
         self.send_command(0x13)
@@ -255,20 +244,13 @@ class EPD:
     def DisplayPartial(self, image):
         self.SetPartReg()
         self.send_command(0x91)
-        self.send_command(0x90)
-        self.send_data(0)
-        self.send_data(self.width - 1)
-
-        self.send_data(0)
-        self.send_data(0)
-        self.send_data(int(self.height / 256))
-        self.send_data(self.height % 256 - 1)
-        self.send_data(0x28)
+        self.send_command_data(0x90, [
+            0, self.width - 1,
+            0, 0, int(self.height / 256), self.height % 256 - 1,
+            0x28])
         
 
-        buf = [0x00] * int(self.width * self.height / 8)
-        for i in range(0, int(self.width * self.height / 8)):
-            buf[i] = ~image[i]
+        buf = bytes(image[:int(self.width * self.height / 8)]).translate(epdbuffer.INVERT)
         self.send_command(0x10)
         self.send_data2(image)
         epdconfig.delay_ms(10)
@@ -281,11 +263,11 @@ class EPD:
         
     def Clear(self):
         self.send_command(0x10)
-        self.send_data2([0x00] * int(self.width * self.height / 8))
+        self.send_data2(epdbuffer.fill(0x00, int(self.width * self.height / 8)))
         epdconfig.delay_ms(10)
         
         self.send_command(0x13)
-        self.send_data2([0xFF] * int(self.width * self.height / 8))
+        self.send_data2(epdbuffer.fill(0xFF, int(self.width * self.height / 8)))
         epdconfig.delay_ms(10)
         
         self.TurnOnDisplay()
@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 792
@@ -127,8 +129,8 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      #  0: idle, 1: busy
-            epdconfig.delay_ms(200)
+        if not epdconfig.busy_wait(0, epdcalibration.DEFAULT_TIMEOUT):      #  0: idle, 1: busy
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         logger.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
@@ -371,64 +373,10 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
     
     def getbuffer_4Gray(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
-        image_monocolor = image.convert('L')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i=0
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((x + (y * self.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
-                        
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = self.height - x - 1
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((newx + (newy * self.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6) 
-        return buf
+        return epdbuffer.getbuffer_4Gray(image, self.width, self.height)
 
     def display(self, imageblack):
         Width =int(self.width / 16)+1
@@ -438,13 +386,13 @@ class EPD:
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 : i * Width1+Width])
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.send_command(0xA4)
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 + Width - 1 : i * Width1 + Width * 2 - 1])
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.TurnOnDisplay()
 
@@ -456,13 +404,13 @@ class EPD:
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 : i * Width1+Width])
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.send_command(0xA4)
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 + Width - 1 : i * Width1 + Width * 2 - 1])
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.TurnOnDisplay()
 
@@ -479,22 +427,22 @@ class EPD:
         Width1 =int(self.width / 8)
         
         self.send_command(0x24)
-        self.send_data2([color] * 13600)
+        self.send_data2(epdbuffer.fill(color, 13600))
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.send_command(0xA4)
-        self.send_data2([color] * 13600)
+        self.send_data2(epdbuffer.fill(color, 13600))
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.TurnOnDisplay()
 
         self.send_command(0x26)
-        self.send_data2([color] * 13600)
+        self.send_data2(epdbuffer.fill(color, 13600))
 
         self.send_command(0xA6)
-        self.send_data2([color] * 13600)
+        self.send_data2(epdbuffer.fill(color, 13600))
 
     def display_Fast(self, imageblack):
         Width =int(self.width / 16)+1
@@ -504,13 +452,13 @@ class EPD:
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 : i * Width1+Width])
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.send_command(0xA4)
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 + Width - 1 : i * Width1 + Width * 2 - 1])
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.TurnOnDisplay_Fast()
     
@@ -651,14 +599,14 @@ class EPD:
 
     def Clear(self):
         self.send_command(0x24)
-        self.send_data2([0xFF] * 13600)
+        self.send_data2(epdbuffer.fill(0xFF, 13600))
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.send_command(0xA4)
-        self.send_data2([0xFF] * 13600)
+        self.send_data2(epdbuffer.fill(0xFF, 13600))
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.TurnOnDisplay()
 
@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 648
@@ -76,10 +78,8 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        self.send_command(0X71)
-        while(epdconfig.digital_read(self.busy_pin) == 0):      #  0: idle, 1: busy
-            self.send_command(0X71)
-            epdconfig.delay_ms(200)
+        if not epdconfig.busy_poll(1, epdcalibration.DEFAULT_TIMEOUT, lambda: self.send_command(0x71), 0.2):      #  0: idle, 1: busy
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         logger.debug("e-Paper busy release")
             
     def init(self):
@@ -120,40 +120,15 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def display(self, imageblack, imagered):
-        buf = [0x00] * int(self.width * self.height / 8)
-        for i in range(0, int(self.width * self.height / 8)):
-            buf[i] = ~imagered[i]
-
         if (imageblack != None):
             self.send_command(0X10)
             self.send_data2(imageblack)        
         if (imagered != None):
             self.send_command(0X13)
-            self.send_data2(buf)
+            self.send_data2(bytes(imagered[:int(self.width * self.height / 8)]).translate(epdbuffer.INVERT))
 
         self.send_command(0x12)
         epdconfig.delay_ms(200) 
@@ -161,9 +136,9 @@ class EPD:
 
     def Clear(self):
         self.send_command(0X10)
-        self.send_data2([0xFF] * int(self.width * self.height / 8))
+        self.send_data2(epdbuffer.fill(0xFF, int(self.width * self.height / 8)))
         self.send_command(0X13)
-        self.send_data2([0x00] * int(self.width * self.height / 8))
+        self.send_data2(epdbuffer.fill(0x00, int(self.width * self.height / 8)))
 
         self.send_command(0x12)
         epdconfig.delay_ms(200) 
@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 640
@@ -75,8 +77,8 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)    
+        if not epdconfig.busy_wait(1, epdcalibration.DEFAULT_TIMEOUT):      # 0: idle, 1: busy
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         logger.debug("e-Paper busy release")
         
     def init(self):
@@ -166,7 +168,7 @@ class EPD:
         self.ReadBusy()
         
     def Clear(self):
-        buf = [0x33] * int(self.width * self.height / 2)
+        buf = epdbuffer.fill(0x33, int(self.width * self.height / 2))
         self.send_command(0x10)
         self.send_data2(buf)
         self.send_command(0x12)
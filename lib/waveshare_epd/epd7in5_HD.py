@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 880
@@ -75,9 +77,8 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 1):
-            busy = epdconfig.digital_read(self.busy_pin)
+        if not epdconfig.busy_wait(0, epdcalibration.DEFAULT_TIMEOUT):
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         epdconfig.delay_ms(200)
         
     def init(self):
@@ -157,7 +158,7 @@ class EPD:
         self.ReadBusy()
         
     def Clear(self):
-        buf = [0xff] * int(self.width * self.height / 8)
+        buf = epdbuffer.fill(0xff, int(self.width * self.height / 8))
         self.send_command(0x4F) 
         self.send_data2([0x00, 0x00])
         self.send_command(0x24)
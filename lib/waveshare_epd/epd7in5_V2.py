@@ -30,6 +30,9 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdsequence
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 800
@@ -45,6 +48,20 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        # refresh mode set by the last init: "full", "fast" or "partial"
+        self.mode = None
+        # refreshes that hung and were retried after a reset
+        self.busy_timeouts = 0
+        self.retrying = False
+        # controller session: whether module_init opened the bus, the
+        # registers written since the last reset (None: unknown, the next
+        # init resets) and whether display_Partial left partial mode on
+        self.bus_open = False
+        self.registers = None
+        self.partial_window = False
+        # bytes sent over SPI in total and for the last frame
+        self.spi_bytes = 0
+        self.frame_bytes = 0
     
     # Hardware reset
     def reset(self):
@@ -54,131 +71,111 @@ class EPD:
         epdconfig.delay_ms(2)
         epdconfig.digital_write(self.reset_pin, 1)
         epdconfig.delay_ms(20)   
+        self.registers = {}
+        self.partial_window = False
 
     def send_command(self, command):
         epdconfig.digital_write(self.dc_pin, 0)
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
+        self.spi_bytes += 1
 
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+        self.spi_bytes += 1
 
     def send_data2(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.SPI.writebytes2(data)
+        epdconfig.spi_writebyte2(data)
         epdconfig.digital_write(self.cs_pin, 1)
+        self.spi_bytes += len(data)
 
-    def ReadBusy(self):
+    # a command and its parameters in one transaction
+    def send_command_data(self, command, data):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+        self.spi_bytes += 1 + len(data)
+
+    # With a mode, the wait is a refresh in that mode: it sleeps through most
+    # of the calibrated duration first and records the measured one.
+    def ReadBusy(self, mode=None):
         logger.debug("e-Paper busy")
-        self.send_command(0x71)
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 0):
-            self.send_command(0x71)
-            busy = epdconfig.digital_read(self.busy_pin)
+        poll = lambda: self.send_command(0x71)
+        if mode is None:
+            released = epdconfig.busy_poll(1, epdcalibration.DEFAULT_TIMEOUT, poll)
+        else:
+            released = epdcalibration.calibration.wait(self, mode, 1, poll)
+        if not released:
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         epdconfig.delay_ms(20)
         logger.debug("e-Paper busy release")
         
-    def init(self):
-        if (epdconfig.module_init() != 0):
-            return -1
+    # Register tables, see epdsequence: (command, params, delay_ms, wait_busy)
+    init_sequence = (
+        (0x06, (0x17, 0x17, 0x28, 0x17), 0, False),     # btst, if an exception is displayed, try 0x38 for the third byte
+        (0x01, (0x07, 0x07, 0x3f, 0x3f), 0, False),     # POWER SETTING: VGH=20V,VGL=-20V VDH=15V VDL=-15V
+        (0x04, (), 100, True),                          # POWER ON
+        (0x00, (0x1F,), 0, False),                      # PANNEL SETTING KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
+        (0x61, (0x03, 0x20, 0x01, 0xE0), 0, False),     # tres: source 800, gate 480
+        (0x15, (0x00,), 0, False),
+        (0x50, (0x10, 0x07), 0, False),                 # VCOM AND DATA INTERVAL SETTING
+        (0x60, (0x22,), 0, False),                      # TCON SETTING
+    )
+
+    init_fast_sequence = (
+        (0x00, (0x1F,), 0, False),                      # PANNEL SETTING
+        (0x50, (0x10, 0x07), 0, False),                 # VCOM AND DATA INTERVAL SETTING
+        (0x04, (), 100, True),                          # POWER ON
+        (0x06, (0x27, 0x27, 0x18, 0x17), 0, False),     # Booster Soft Start, enhanced display drive
+        (0xE0, (0x02,), 0, False),
+        (0xE5, (0x5A,), 0, False),
+    )
+
+    init_part_sequence = (
+        (0x00, (0x1F,), 0, False),                      # PANNEL SETTING
+        (0x04, (), 100, True),                          # POWER ON
+        (0xE0, (0x02,), 0, False),
+        (0xE5, (0x6E,), 0, False),
+    )
+
+    # Brings the controller into `mode` with the register table `sequence`.
+    # module_init only runs while the bus is closed. The reset is skipped when
+    # every register written since the last reset is written by `sequence`
+    # as well, so the result equals a fresh init; then only the actions and
+    # the registers that differ are sent.
+    def enter(self, mode, sequence):
+        if not self.bus_open:
+            if (epdconfig.module_init() != 0):
+                return -1
+            self.bus_open = True
         # EPD hardware init start
-        self.reset()
-        
-        self.send_command(0x06)     # btst
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_data(0x28)        # If an exception is displayed, try using 0x38
-        self.send_data(0x17)
-        
-        self.send_command(0x01)			#POWER SETTING
-        self.send_data(0x07)
-        self.send_data(0x07)    #VGH=20V,VGL=-20V
-        self.send_data(0x3f)		#VDH=15V
-        self.send_data(0x3f)		#VDL=-15V
-
-        self.send_command(0x04) #POWER ON
-        epdconfig.delay_ms(100)
-        self.ReadBusy()
-
-        self.send_command(0X00)			#PANNEL SETTING
-        self.send_data(0x1F)   #KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
-
-        self.send_command(0x61)        	#tres
-        self.send_data(0x03)		#source 800
-        self.send_data(0x20)
-        self.send_data(0x01)		#gate 480
-        self.send_data(0xE0)
-
-        self.send_command(0X15)
-        self.send_data(0x00)
-
-        self.send_command(0X50)			#VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x10)
-        self.send_data(0x07)
-
-        self.send_command(0X60)			#TCON SETTING
-        self.send_data(0x22)
-
+        if self.registers is None or not set(self.registers) <= set(epdsequence.registers(sequence)):
+            self.reset()
+        elif self.partial_window:
+            self.send_command(0x92)     # partial out
+            self.partial_window = False
+        epdsequence.run(self, epdsequence.diff(sequence, self.registers), registers=self.registers)
+        self.mode = mode
         # EPD hardware init end
         return 0
+
+    def init(self):
+        return self.enter("full", self.init_sequence)
     
     def init_fast(self):
-        if (epdconfig.module_init() != 0):
-            return -1
-        # EPD hardware init start
-        self.reset()
-        
-        self.send_command(0X00)			#PANNEL SETTING
-        self.send_data(0x1F)   #KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
-
-        self.send_command(0X50)			#VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x10)
-        self.send_data(0x07)
-
-        self.send_command(0x04) #POWER ON
-        epdconfig.delay_ms(100) 
-        self.ReadBusy()        #waiting for the electronic paper IC to release the idle signal
-
-        #Enhanced display drive(Add 0x06 command)
-        self.send_command(0x06)			#Booster Soft Start 
-        self.send_data (0x27)
-        self.send_data (0x27)   
-        self.send_data (0x18)		
-        self.send_data (0x17)		
-
-        self.send_command(0xE0)
-        self.send_data(0x02)
-        self.send_command(0xE5)
-        self.send_data(0x5A)
-
-        # EPD hardware init end
-        return 0
+        return self.enter("fast", self.init_fast_sequence)
     
     def init_part(self):
-        if (epdconfig.module_init() != 0):
-            return -1
-        # EPD hardware init start
-        self.reset()
-
-        self.send_command(0X00)			#PANNEL SETTING
-        self.send_data(0x1F)   #KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
-
-        self.send_command(0x04) #POWER ON
-        epdconfig.delay_ms(100) 
-        self.ReadBusy()        #waiting for the electronic paper IC to release the idle signal
-
-        self.send_command(0xE0)
-        self.send_data(0x02)
-        self.send_command(0xE5)
-        self.send_data(0x6E)
-
-        # EPD hardware init end
-        return 0
+        return self.enter("partial", self.init_part_sequence)
 
     def getbuffer(self, image):
         img = image
@@ -191,97 +188,103 @@ class EPD:
         else:
             logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
             # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
+            return bytearray(int(self.width/8) * self.height)
 
-        buf = bytearray(img.tobytes('raw'))
         # The bytes need to be inverted, because in the PIL world 0=black and 1=white, but
         # in the e-paper world 0=white and 1=black.
-        for i in range(len(buf)):
-            buf[i] ^= 0xFF
+        buf = bytearray(img.tobytes('raw').translate(epdbuffer.INVERT))
         return buf
 
-    def display(self, image):
-        if(self.width % 8 == 0):
-            Width = self.width // 8
-        else:
-            Width = self.width // 8 +1
-        Height = self.height
-        image1 = [0xFF] * int(self.width * self.height / 8)
-        for j in range(Height):
-                for i in range(Width):
-                    image1[i + j * Width] = ~image[i + j * Width]
-        self.send_command(0x10)
-        self.send_data2(image1)
+    # image1 is the old data plane (the inverse of image). Callers that already
+    # hold both planes can pass it in, otherwise it is derived here.
+    def display(self, image, image1=None):
+        start = self.spi_bytes
+        if image1 is None:
+            image1 = bytes(image).translate(epdbuffer.INVERT)
+        self.send_command_data(0x10, image1)
 
-        self.send_command(0x13)
-        self.send_data2(image)
+        self.send_command_data(0x13, image)
 
-        self.send_command(0x12)
-        epdconfig.delay_ms(100)
-        self.ReadBusy()
+        self.refresh(self.display, image, image1)
+        self.frame_bytes = self.spi_bytes - start
 
     def Clear(self):
-        self.send_command(0x10)
-        self.send_data2([0xFF] * int(self.width * self.height / 8))
-        self.send_command(0x13)
-        self.send_data2([0x00] * int(self.width * self.height / 8))
+        start = self.spi_bytes
+        self.send_command_data(0x10, epdbuffer.fill(0xFF, int(self.width * self.height / 8)))
+        self.send_command_data(0x13, epdbuffer.fill(0x00, int(self.width * self.height / 8)))
 
-        self.send_command(0x12)
-        epdconfig.delay_ms(100)
-        self.ReadBusy()
+        self.refresh(self.Clear)
+        self.frame_bytes = self.spi_bytes - start
 
     def display_Partial(self, Image, Xstart, Ystart, Xend, Yend):
-        if((Xstart % 8 + Xend % 8 == 8 & Xstart % 8 > Xend % 8) | Xstart % 8 + Xend % 8 == 0 | (Xend - Xstart)%8 == 0):
-            Xstart = Xstart // 8 * 8
-            Xend = Xend // 8 * 8
-        else:
-            Xstart = Xstart // 8 * 8
-            if Xend % 8 == 0:
-                Xend = Xend // 8 * 8
-            else:
-                Xend = Xend // 8 * 8 + 1
-                
+        start = self.spi_bytes
+        # The window covers whole bytes: Xstart is rounded down and Xend up
+        # to a multiple of 8. Image holds its rows, (Xend - Xstart) / 8 bytes
+        # each.
+        Xstart = Xstart // 8 * 8
+        Xend = (Xend + 7) // 8 * 8
         Width = (Xend - Xstart) // 8
         Height = Yend - Ystart
 	
-        self.send_command(0x50)
-        self.send_data(0xA9)
-        self.send_data(0x07)
+        self.send_command_data(0x50, [0xA9, 0x07])
+        if self.registers is not None:
+            self.registers[0x50] = bytes([0xA9, 0x07])
 
         self.send_command(0x91)		#This command makes the display enter partial mode
-        self.send_command(0x90)		#resolution setting
-        self.send_data (Xstart//256)
-        self.send_data (Xstart%256)   #x-start    
-
-        self.send_data ((Xend-1)//256)		
-        self.send_data ((Xend-1)%256)  #x-end	
-
-        self.send_data (Ystart//256)  #
-        self.send_data (Ystart%256)   #y-start    
-
-        self.send_data ((Yend-1)//256)		
-        self.send_data ((Yend-1)%256)  #y-end
-        self.send_data (0x01)
-
-        image1 = [0xFF] * int(self.width * self.height / 8)
-        for j in range(Height):
-                for i in range(Width):
-                    image1[i + j * Width] = ~Image[i + j * Width]
-
-        self.send_command(0x13)   #Write Black and White image to RAM
-        self.send_data2(image1)
-
+        self.partial_window = True
+        self.send_command_data(0x90, [     #resolution setting
+            Xstart//256, Xstart%256,            #x-start
+            (Xend-1)//256, (Xend-1)%256,        #x-end
+            Ystart//256, Ystart%256,            #y-start
+            (Yend-1)//256, (Yend-1)%256,        #y-end
+            0x01])
+
+        # only the window's bytes, the controller fills the window and
+        # leaves the rest of the RAM alone
+        image1 = bytes(Image[:Width * Height]).translate(epdbuffer.INVERT)
+
+        self.send_command_data(0x13, image1)   #Write Black and White image to RAM
+
+        self.refresh(self.display_Partial, Image, Xstart, Ystart, Xend, Yend)
+        self.frame_bytes = self.spi_bytes - start
+
+    # Starts the refresh of the frame just written and waits for it. If the
+    # panel is still busy at the deadline, it is reset and re-initialised into
+    # the same mode and frame(*args) sends the frame once more.
+    def refresh(self, frame, *args):
         self.send_command(0x12)
         epdconfig.delay_ms(100)
-        self.ReadBusy()
+        try:
+            self.ReadBusy(self.mode)
+        except epdconfig.BusyTimeout:
+            if self.retrying:
+                raise
+            self.busy_timeouts += 1
+            logger.warning("e-Paper %s refresh timed out, resetting (%d so far)" % (self.mode, self.busy_timeouts))
+            self.retrying = True
+            try:
+                self.reinit()
+                frame(*args)
+            finally:
+                self.retrying = False
+
+    # Hardware reset and init into the current mode
+    def reinit(self):
+        self.registers = None
+        if self.mode == "fast":
+            return self.init_fast()
+        if self.mode == "partial":
+            return self.init_part()
+        return self.init()
 
     def sleep(self):
         self.send_command(0x02) # POWER_OFF
         self.ReadBusy()
         
-        self.send_command(0x07) # DEEP_SLEEP
-        self.send_data(0XA5)
+        self.send_command_data(0x07, [0XA5]) # DEEP_SLEEP
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
+        self.bus_open = False
+        self.registers = None
 ### END OF FILE ###
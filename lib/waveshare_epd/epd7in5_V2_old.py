@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 800
@@ -227,13 +229,19 @@ class EPD:
         epdconfig.spi_writebyte2(data)
         epdconfig.digital_write(self.cs_pin, 1)
 
+    # a command and its parameters in one transaction
+    def send_command_data(self, command, data):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        self.send_command(0x71)
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 0):
-            self.send_command(0x71)
-            busy = epdconfig.digital_read(self.busy_pin)
+        if not epdconfig.busy_poll(1, epdcalibration.DEFAULT_TIMEOUT, lambda: self.send_command(0x71)):
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         epdconfig.delay_ms(20)
         logger.debug("e-Paper busy release")
         
@@ -437,11 +445,9 @@ class EPD:
             # return a blank buffer
             return [0x00] * (int(self.width/8) * self.height)
 
-        buf = bytearray(img.tobytes('raw'))
         # The bytes need to be inverted, because in the PIL world 0=black and 1=white, but
         # in the e-paper world 0=white and 1=black.
-        for i in range(len(buf)):
-            buf[i] ^= 0xFF
+        buf = bytearray(img.tobytes('raw').translate(epdbuffer.INVERT))
         return buf
 
     def display(self, image):
@@ -450,10 +456,7 @@ class EPD:
         else:
             Width = self.width // 8 +1
         Height = self.height
-        image1 = [0xFF] * int(self.width * self.height / 8)
-        for j in range(Height):
-                for i in range(Width):
-                    image1[i + j * Width] = ~image[i + j * Width]
+        image1 = bytes(image[:Width * Height]).translate(epdbuffer.INVERT)
         self.send_command(0x10)
         self.send_data2(image1)
 
@@ -466,9 +469,9 @@ class EPD:
 
     def Clear(self):
         self.send_command(0x10)
-        self.send_data2([0xFF] * int(self.width * self.height / 8))
+        self.send_data2(epdbuffer.fill(0xFF, int(self.width * self.height / 8)))
         self.send_command(0x13)
-        self.send_data2([0x00] * int(self.width * self.height / 8))
+        self.send_data2(epdbuffer.fill(0x00, int(self.width * self.height / 8)))
         self.send_command(0x12)
         epdconfig.delay_ms(100)
         self.ReadBusy()
@@ -487,32 +490,22 @@ class EPD:
         Width = (Xend - Xstart) // 8
         Height = Yend - Ystart
 	
-        self.send_command(0x50)
-        self.send_data(0xA9)
-        self.send_data(0x07)
+        self.send_command_data(0x50, [0xA9, 0x07])
 
         self.send_command(0x91)		#This command makes the display enter partial mode
-        self.send_command(0x90)		#resolution setting
-        self.send_data (Xstart//256)
-        self.send_data (Xstart%256)   #x-start    
-
-        self.send_data ((Xend-1)//256)		
-        self.send_data ((Xend-1)%256)  #x-end	
-
-        self.send_data (Ystart//256)  #
-        self.send_data (Ystart%256)   #y-start    
-
-        self.send_data ((Yend-1)//256)		
-        self.send_data ((Yend-1)%256)  #y-end
-        self.send_data (0x01)
+        self.send_command_data(0x90, [     #resolution setting
+            Xstart//256, Xstart%256,            #x-start
+            (Xend-1)//256, (Xend-1)%256,        #x-end
+            Ystart//256, Ystart%256,            #y-start
+            (Yend-1)//256, (Yend-1)%256,        #y-end
+            0x01])
 
-        image1 = [0xFF] * int(self.width * self.height / 8)
-        for j in range(Height):
-                for i in range(Width):
-                    image1[i + j * Width] = ~Image[i + j * Width]
+        image1 = bytes(Image[:Width * Height]).translate(epdbuffer.INVERT)
 
         self.send_command(0x13)   #Write Black and White image to RAM
         self.send_data2(image1)
+        # the rest of a full frame, as the old loop sent it
+        self.send_data2(epdbuffer.fill(0xFF, int(self.width * self.height / 8) - Width * Height))
 
         self.send_command(0x12)
         epdconfig.delay_ms(100)
@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcalibration
 
 # Display resolution
 EPD_WIDTH       = 800
@@ -75,11 +77,8 @@ class EPD:
 
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        self.send_command(0x71)
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 0):
-            self.send_command(0x71)
-            busy = epdconfig.digital_read(self.busy_pin)
+        if not epdconfig.busy_poll(1, epdcalibration.DEFAULT_TIMEOUT, lambda: self.send_command(0x71)):
+            raise epdconfig.BusyTimeout("e-Paper busy for too long")
         epdconfig.delay_ms(200)
         logger.debug("e-Paper busy release")
         
@@ -145,11 +144,9 @@ class EPD:
             # return a blank buffer
             return [0x00] * (int(self.width/8) * self.height)
 
-        buf = bytearray(img.tobytes('raw'))
         # The bytes need to be inverted, because in the PIL world 0=black and 1=white, but
         # in the e-paper world 0=white and 1=black.
-        for i in range(len(buf)):
-            buf[i] ^= 0xFF
+        buf = bytearray(img.tobytes('raw').translate(epdbuffer.INVERT))
         return buf
 
     def display(self, imageblack, imagered):
@@ -167,8 +164,8 @@ class EPD:
         self.ReadBusy()
         
     def Clear(self):
-        buf = [0x00] * (int(self.width/8) * self.height)
-        buf2 = [0xff] * (int(self.width/8) * self.height)
+        buf = epdbuffer.fill(0x00, int(self.width/8) * self.height)
+        buf2 = epdbuffer.fill(0xff, int(self.width/8) * self.height)
         self.send_command(0x10)
         self.send_data2(buf2)
             
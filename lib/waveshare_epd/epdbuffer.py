@@ -0,0 +1,237 @@
+# *****************************************************************************
+# * | File        :	  epdbuffer.py
+# * | Function    :   Frame buffer packing shared by the e-Paper drivers
+# * | Info        :
+# *----------------
+# * | This version:   V1.0
+# * | Date        :   2026-10-17
+# -----------------------------------------------------------------------------
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documnetation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to  whom the Software is
+# furished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS OR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+import logging
+from PIL import Image, ImageChops
+
+logger = logging.getLogger(__name__)
+
+# Flips every bit of a byte when passed to bytes.translate
+INVERT = bytes(range(0xFF, -1, -1))
+
+# Maps an 8 bit gray value to the 2 bit level the 4 gray drivers send:
+# GRAY2 (0xC0) and GRAY3 (0x80) are moved down one level, every other value
+# keeps its top two bits.
+GRAY4_LEVELS = [0x02 if v == 0xC0 else 0x01 if v == 0x80 else v >> 6 for v in range(256)]
+
+# Moves a 2 bit value into each of the four positions of a byte, first
+# pixel in the most significant bits.
+SHIFT_2BIT = [bytes((v & 0x03) << shift for v in range(256)) for shift in (6, 4, 2, 0)]
+
+# Moves a 4 bit value into the high nibble of a byte
+SHIFT_4BIT = bytes((v & 0x0F) << 4 for v in range(256))
+
+_fills = {}
+
+# Returns `size` bytes of `value`, for clearing panel RAM. Built once per
+# value and size and shared, so repeated clears allocate nothing.
+def fill(value, size):
+    key = (value, int(size))
+    buf = _fills.get(key)
+    if buf is None:
+        buf = bytes([value]) * key[1]
+        _fills[key] = buf
+    return buf
+
+# Packs an image into a 1 bit per pixel buffer for a width x height panel:
+# rows of width/8 bytes, most significant bit first, 1=white and 0=black.
+# Images in portrait orientation (height x width) are rotated by 90 degrees
+# counterclockwise first. Images of any other size give an all white buffer.
+# The width must be a multiple of 8.
+def getbuffer(image, width, height):
+    img = image.convert('1')
+    imwidth, imheight = img.size
+    if(imwidth == width and imheight == height):
+        pass
+    elif(imwidth == height and imheight == width):
+        img = img.transpose(Image.Transpose.ROTATE_90)
+    else:
+        return bytearray([0xFF]) * (width // 8 * height)
+
+    return bytearray(img.tobytes('raw'))
+
+# Packs a buffer of 2 bit values (one per byte) into four values per byte.
+# Every fourth value is shifted into place with a lookup table and the four
+# shifted streams are merged with a single integer OR.
+def pack_2bit(values):
+    merged = 0
+    for i in range(4):
+        merged |= int.from_bytes(values[i::4].translate(SHIFT_2BIT[i]), 'big')
+    return bytearray(merged.to_bytes(len(values) // 4, 'big'))
+
+# Packs an image into the 2 bit per pixel buffer of the 4 gray drivers, see
+# GRAY4_LEVELS. Portrait images are turned with `transpose`, which differs
+# between drivers. The width must be a multiple of 4.
+def getbuffer_4Gray(image, width, height, transpose=Image.Transpose.ROTATE_90):
+    img = image.convert('L')
+    imwidth, imheight = img.size
+    if(imwidth == width and imheight == height):
+        pass
+    elif(imwidth == height and imheight == width):
+        img = img.transpose(transpose)
+    else:
+        return bytearray([0xFF]) * (width // 4 * height)
+
+    return pack_2bit(img.point(GRAY4_LEVELS).tobytes('raw'))
+
+# Lookup tables turning the four 2 bit pixels of a byte into a nibble of
+# plane bits, in the high and in the low half of the byte, per level mapping.
+_split_tables = {}
+
+def _split_table(levels):
+    tables = _split_tables.get(levels)
+    if tables is None:
+        nibbles = [0] * 256
+        for v in range(256):
+            for k in range(4):
+                nibbles[v] |= levels[(v >> (6 - 2 * k)) & 0x03] << (3 - k)
+        tables = (bytes(n << 4 for n in nibbles), bytes(nibbles))
+        _split_tables[levels] = tables
+    return tables
+
+# Splits a buffer from getbuffer_4Gray into the two 1 bit planes written to
+# the controller RAMs. levels1 and levels2 give the bit each gray level sets
+# in the first and second plane, indexed by level: black, GRAY3, GRAY2, white.
+# Each pair of input bytes becomes one output byte.
+def split_4Gray(image, levels1, levels2):
+    data = bytes(image)
+    even = data[0::2]
+    odd = data[1::2]
+    planes = []
+    for levels in (levels1, levels2):
+        (high, low) = _split_table(levels)
+        merged = int.from_bytes(even.translate(high), 'big') | int.from_bytes(odd.translate(low), 'big')
+        planes.append(bytearray(merged.to_bytes(len(odd), 'big')))
+    return planes
+
+# The 7 colors of the ACeP panels, in the order of their 4 bit color index:
+# black, white, green, blue, red, yellow, orange.
+ACEP_PALETTE = (0,0,0,  255,255,255,  0,255,0,  0,0,255,  255,0,0,  255,255,0,  255,128,0)
+
+# 8x8 Bayer matrix, thresholds 0..63
+BAYER_8X8 = (
+    0, 32,  8, 40,  2, 34, 10, 42,
+   48, 16, 56, 24, 50, 18, 58, 26,
+   12, 44,  4, 36, 14, 46,  6, 38,
+   60, 28, 52, 20, 62, 30, 54, 22,
+    3, 35, 11, 43,  1, 33,  9, 41,
+   51, 19, 59, 27, 49, 17, 57, 25,
+   15, 47,  7, 39, 13, 45,  5, 37,
+   63, 31, 55, 23, 61, 29, 53, 21)
+
+_palette_images = {}
+_bayer_images = {}
+
+# Returns a "P" mode image holding `colors` (flat RGB tuple) as its palette,
+# for Image.quantize. Built once per palette.
+def palette_image(colors):
+    pal_image = _palette_images.get(colors)
+    if pal_image is None:
+        pal_image = Image.new("P", (1, 1))
+        pal_image.putpalette(colors + (0, 0, 0) * (256 - len(colors) // 3))
+        _palette_images[colors] = pal_image
+    return pal_image
+
+# Returns an RGB image of the given size tiled with the Bayer thresholds,
+# scaled to 1..119 on every channel. Built once per size.
+def _bayer_image(size):
+    bayer = _bayer_images.get(size)
+    if bayer is None:
+        (width, height) = size
+        repeat = width // 8 + 1
+        rows = [bytes(v * 15 // 8 + 1 for v in BAYER_8X8[r * 8:r * 8 + 8]) * repeat for r in range(8)]
+        data = b''.join(rows[y % 8][:width] for y in range(height))
+        channel = Image.frombytes('L', size, data)
+        bayer = Image.merge('RGB', (channel, channel, channel))
+        _bayer_images[size] = bayer
+    return bayer
+
+# Maps an image to the indices of the palette `colors` (flat RGB tuple), one
+# byte per pixel. dither is one of Image.Dither.NONE, Image.Dither.ORDERED
+# (8x8 Bayer) or Image.Dither.FLOYDSTEINBERG.
+def quantize(image, colors, dither=Image.Dither.FLOYDSTEINBERG):
+    img = image.convert('RGB')
+    if dither == Image.Dither.ORDERED:
+        # Move each pixel by its threshold, -59..59, and snap to the nearest
+        # color. The spread stays below half the distance between palette
+        # colors (orange is 128 away from red and yellow), so pixels already
+        # in the palette keep their color.
+        img = ImageChops.add(img, _bayer_image(img.size), 1.0, -60)
+        dither = Image.Dither.NONE
+    elif dither != Image.Dither.NONE:
+        dither = Image.Dither.FLOYDSTEINBERG
+    return img.quantize(palette=palette_image(colors), dither=dither).tobytes('raw')
+
+# Packs a buffer of 4 bit values (one per byte) into two values per byte,
+# first pixel in the high nibble.
+def pack_4bit(values):
+    merged = int.from_bytes(values[0::2].translate(SHIFT_4BIT), 'big') | int.from_bytes(values[1::2], 'big')
+    return merged.to_bytes(len(values) // 2, 'big')
+
+# Packs an image into the 4 bit per pixel buffer of the ACeP 7 color panels
+# for a width x height panel, see ACEP_PALETTE. Portrait images are rotated
+# by 90 degrees counterclockwise first; images of any other size give an all
+# white buffer. Returns bytes.
+def getbuffer_7Color(image, width, height, dither=Image.Dither.FLOYDSTEINBERG):
+    imwidth, imheight = image.size
+    if(imwidth == width and imheight == height):
+        pass
+    elif(imwidth == height and imheight == width):
+        image = image.transpose(Image.Transpose.ROTATE_90)
+    else:
+        logger.warning("Invalid image dimensions: %d x %d, expected %d x %d" % (imwidth, imheight, width, height))
+        return bytes([0x11]) * (width // 2 * height)
+
+    return pack_4bit(quantize(image, ACEP_PALETTE, dither))
+
+# The 4 colors of the "g" panels, in the order of their 2 bit color index:
+# black, white, yellow, red.
+BWYR_PALETTE = (0,0,0,  255,255,255,  255,255,0,  255,0,0)
+
+# Packs an image into the 2 bit per pixel buffer of the 4 color "g" panels
+# for a width x height panel, see BWYR_PALETTE. Rows are padded with black
+# to a whole byte. Portrait images are rotated by 90 degrees counterclockwise
+# first; images of any other size give an all white buffer.
+def getbuffer_4Color(image, width, height, dither=Image.Dither.FLOYDSTEINBERG):
+    linewidth = (width + 3) // 4
+    imwidth, imheight = image.size
+    if(imwidth == width and imheight == height):
+        pass
+    elif(imwidth == height and imheight == width):
+        image = image.transpose(Image.Transpose.ROTATE_90)
+    else:
+        logger.warning("Invalid image dimensions: %d x %d, expected %d x %d" % (imwidth, imheight, width, height))
+        return bytearray([0x55]) * (linewidth * height)
+
+    values = quantize(image, BWYR_PALETTE, dither)
+    if width % 4:
+        padded = Image.new('L', (linewidth * 4, height), 0)
+        padded.paste(Image.frombytes('L', (width, height), values))
+        values = padded.tobytes('raw')
+    return pack_2bit(values)
+
+### END OF FILE ###
@@ -0,0 +1,121 @@
+# *****************************************************************************
+# * | File        :	  epdcalibration.py
+# * | Function    :   Measured busy durations per driver and refresh mode
+# * | Info        :
+# *----------------
+# * | This version:   V1.0
+# * | Date        :   2026-10-17
+# -----------------------------------------------------------------------------
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documnetation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to  whom the Software is
+# furished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS OR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+import json
+import logging
+import time
+
+from . import epdconfig
+
+logger = logging.getLogger(__name__)
+
+# Share of the predicted busy time that is slept before watching the BUSY
+# line, and the weight of a new measurement in the running average.
+SLEEP_FRACTION = 0.8
+SMOOTHING = 0.25
+
+# Busy waits give up after TIMEOUT_FACTOR times the predicted duration, but
+# not before MIN_TIMEOUT seconds, and after DEFAULT_TIMEOUT seconds while
+# there is no prediction yet. The drivers without calibration always wait
+# DEFAULT_TIMEOUT, which leaves room for the slowest panels (the 7 color
+# ACeP and large 3 color ones take up to about 35 s per refresh).
+TIMEOUT_FACTOR = 3.0
+MIN_TIMEOUT = 2.0
+DEFAULT_TIMEOUT = 60.0
+
+# Busy durations in seconds per (driver, mode), kept as a running average of
+# the measured waits. Drivers pass themselves, the store keys them by module
+# name (e.g. "epd7in5_V2"); modes are free-form strings such as "full",
+# "fast" or "partial". Temperature is not part of the key, the average
+# follows slow drifts on its own.
+class BusyCalibration:
+    def __init__(self, path=None):
+        self.path = path
+        self.durations = {}
+        if path is not None:
+            self.load()
+
+    @staticmethod
+    def key(driver, mode):
+        if not isinstance(driver, str):
+            driver = type(driver).__module__.rsplit('.', 1)[-1]
+        return driver + '/' + mode
+
+    # Predicted busy seconds, or None before the first measurement
+    def predict(self, driver, mode):
+        return self.durations.get(self.key(driver, mode))
+
+    # Seconds after which a busy wait counts as hung
+    def deadline(self, driver, mode):
+        predicted = self.predict(driver, mode)
+        if predicted is None:
+            return DEFAULT_TIMEOUT
+        return max(MIN_TIMEOUT, predicted * TIMEOUT_FACTOR)
+
+    def record(self, driver, mode, seconds):
+        key = self.key(driver, mode)
+        previous = self.durations.get(key)
+        if previous is None:
+            self.durations[key] = seconds
+        else:
+            self.durations[key] = previous + SMOOTHING * (seconds - previous)
+
+    # Waits for the BUSY line to read `level`: sleeps through most of the
+    # predicted duration, then waits for the pin, and records the total.
+    # With `poll`, the pin is watched with epdconfig.busy_poll. Returns
+    # False, recording nothing, when the deadline passes first.
+    def wait(self, driver, mode, level, poll=None):
+        start = time.monotonic()
+        deadline = self.deadline(driver, mode)
+        predicted = self.predict(driver, mode)
+        if predicted:
+            time.sleep(predicted * SLEEP_FRACTION)
+        remaining = max(0.0, deadline - (time.monotonic() - start))
+        if poll is None:
+            released = epdconfig.busy_wait(level, remaining)
+        else:
+            released = epdconfig.busy_poll(level, remaining, poll)
+        if not released:
+            return False
+        self.record(driver, mode, time.monotonic() - start)
+        return True
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.durations.update(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.debug("no busy calibration loaded from %s: %s" % (self.path, e))
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump(self.durations, f, indent=1, sort_keys=True)
+
+# The store the drivers record into
+calibration = BusyCalibration()
+
+### END OF FILE ###
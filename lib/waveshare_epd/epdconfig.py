@@ -37,6 +37,64 @@ from ctypes import *
 
 logger = logging.getLogger(__name__)
 
+# Largest single transfer the spidev kernel driver accepts
+SPIDEV_BUFSIZ = '/sys/module/spidev/parameters/bufsiz'
+
+def spi_bufsiz(default=4096):
+    try:
+        with open(SPIDEV_BUFSIZ) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return default
+
+# Raised by the drivers when the BUSY line does not release in time
+class BusyTimeout(RuntimeError):
+    """The controller state is unknown afterwards: callers must init() the
+    driver again (which resets the panel) before sending it anything else."""
+
+# Blocks until `pin` reads `level` using RPi.GPIO style edge detection
+# (Jetson.GPIO, Hobot.GPIO). Edges are awaited in slices of 100 ms so an edge
+# that happens between the level check and the wait is never missed for
+# longer than that. Falls back to polling every 10 ms where edge detection
+# is not available. Returns False when `timeout` (seconds) runs out first.
+def gpio_busy_wait(gpio, pin, level, timeout=None):
+    edge = gpio.RISING if level else gpio.FALLING
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while gpio.input(pin) != level:
+        remaining = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+        if remaining <= 0:
+            return False
+        try:
+            gpio.wait_for_edge(pin, edge, timeout=max(1, int(remaining * 1000)))
+        except (AttributeError, RuntimeError, ValueError):
+            time.sleep(min(remaining, 0.01))
+    return True
+
+# Waits like busy_wait for the controllers (UC81xx) whose BUSY line follows a
+# GET_STATUS (0x71) read: `poll()` sends it before every slice of `interval`
+# seconds, as their vendor loops did. Returns False when `timeout` (seconds)
+# runs out first.
+def busy_poll(level, timeout, poll, interval=0.1):
+    deadline = time.monotonic() + timeout
+    while True:
+        poll()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if busy_wait(level, min(interval, remaining)):
+            return True
+
+# Splits bytes, bytearray, memoryview (or, for older callers, a list of
+# ints) into memoryview chunks of at most `size` bytes, without copying.
+# List items are truncated to a byte as spidev does, so the negative ints
+# of `~x` still send the inverted byte.
+def spi_chunks(data, size):
+    if isinstance(data, list):
+        data = bytes(b & 0xFF for b in data)
+    view = memoryview(data).cast('B')
+    for i in range(0, len(view), size):
+        yield view[i:i + size]
+
 
 class RaspberryPi:
     # Pin definition
@@ -53,6 +111,7 @@ class RaspberryPi:
         import gpiozero
         
         self.SPI = spidev.SpiDev()
+        self.SPI_BUFSIZ = spi_bufsiz()
         self.GPIO_RST_PIN    = gpiozero.LED(self.RST_PIN)
         self.GPIO_DC_PIN     = gpiozero.LED(self.DC_PIN)
         # self.GPIO_CS_PIN     = gpiozero.LED(self.CS_PIN)
@@ -95,6 +154,14 @@ class RaspberryPi:
         elif pin == self.PWR_PIN:
             return self.PWR_PIN.value
 
+    # Blocks until the BUSY line reads `level`. gpiozero watches the pin
+    # and sets an event on each edge, so the caller sleeps instead of
+    # polling. Returns False when `timeout` (seconds) runs out first.
+    def busy_wait(self, level, timeout=None):
+        if level:
+            return self.GPIO_BUSY_PIN.wait_for_press(timeout)
+        return self.GPIO_BUSY_PIN.wait_for_release(timeout)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
@@ -102,7 +169,8 @@ class RaspberryPi:
         self.SPI.writebytes(data)
 
     def spi_writebyte2(self, data):
-        self.SPI.writebytes2(data)
+        for chunk in spi_chunks(data, self.SPI_BUFSIZ):
+            self.SPI.writebytes2(chunk)
 
     def DEV_SPI_write(self, data):
         self.DEV_SPI.DEV_SPI_SendData(data)
@@ -198,6 +266,9 @@ class JetsonNano:
     def digital_read(self, pin):
         return self.GPIO.input(self.BUSY_PIN)
 
+    def busy_wait(self, level, timeout=None):
+        return gpio_busy_wait(self.GPIO, self.BUSY_PIN, level, timeout)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
@@ -249,6 +320,7 @@ class SunriseX3:
 
         self.GPIO = Hobot.GPIO
         self.SPI = spidev.SpiDev()
+        self.SPI_BUFSIZ = spi_bufsiz()
 
     def digital_write(self, pin, value):
         self.GPIO.output(pin, value)
@@ -256,6 +328,9 @@ class SunriseX3:
     def digital_read(self, pin):
         return self.GPIO.input(pin)
 
+    def busy_wait(self, level, timeout=None):
+        return gpio_busy_wait(self.GPIO, self.BUSY_PIN, level, timeout)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
@@ -265,7 +340,8 @@ class SunriseX3:
     def spi_writebyte2(self, data):
         # for i in range(len(data)):
         #     self.SPI.writebytes([data[i]])
-        self.SPI.xfer3(data)
+        for chunk in spi_chunks(data, self.SPI_BUFSIZ):
+            self.SPI.xfer3(chunk)
 
     def module_init(self):
         if self.Flag == 0:
@@ -0,0 +1,76 @@
+# *****************************************************************************
+# * | File        :	  epdsequence.py
+# * | Function    :   Register tables and their executor for the e-Paper drivers
+# * | Info        :
+# *----------------
+# * | This version:   V1.0
+# * | Date        :   2026-10-17
+# -----------------------------------------------------------------------------
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documnetation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to  whom the Software is
+# furished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS OR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+from . import epdconfig
+
+# Init sequences and LUT uploads are tables of steps
+#
+#     (command, params, delay_ms, wait_busy)
+#
+# command is the command byte, params the bytes that follow it (may be
+# empty), delay_ms a sleep after sending and wait_busy whether to wait for
+# the busy line after that. A step with params, no delay and no busy wait
+# is a register write: repeating it with the same params changes nothing,
+# which is what lets diff() drop it. Every other step is an action (power
+# on, refresh, ...) and is always sent.
+
+def is_register(step):
+    (command, params, delay_ms, wait_busy) = step
+    return len(params) > 0 and not delay_ms and not wait_busy
+
+# Replays a sequence on a driver with one transaction per command, see
+# send_command_data. Params are sent as bytes, the SPI transport does not
+# take tuples. `busy` is the driver's busy wait, ReadBusy by default.
+# When `registers` is given, the register writes are recorded in it, params
+# as bytes.
+def run(epd, sequence, busy=None, registers=None):
+    if busy is None:
+        busy = epd.ReadBusy
+    for step in sequence:
+        (command, params, delay_ms, wait_busy) = step
+        if params:
+            epd.send_command_data(command, bytes(params))
+        else:
+            epd.send_command(command)
+        if delay_ms:
+            epdconfig.delay_ms(delay_ms)
+        if wait_busy:
+            busy()
+        if registers is not None and is_register(step):
+            registers[command] = bytes(params)
+
+# The register values a sequence leaves behind
+def registers(sequence):
+    return {step[0]: bytes(step[1]) for step in sequence if is_register(step)}
+
+# The steps of `sequence` still needed on a controller whose registers hold
+# `registers` (as filled in by run): every action, and the register writes
+# whose params differ.
+def diff(sequence, registers):
+    return [step for step in sequence if not is_register(step) or registers.get(step[0]) != bytes(step[1])]
+
+### END OF FILE ###
@@ -0,0 +1,158 @@
+# Loads the drivers and example/piink.py without the panel: epdconfig picks
+# its Raspberry Pi implementation, backed by stand-ins for spidev and
+# gpiozero that record every transfer on a shared bus.
+import os
+import subprocess
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lib'))
+sys.path.insert(0, os.path.join(ROOT, 'example'))
+
+DC_PIN = 25
+
+
+class Bus:
+    def __init__(self):
+        self.dc = 0
+        self.transfers = []
+        # whether transfers are kept, off while allocations are measured
+        self.keep = True
+
+    def clear(self):
+        self.transfers.clear()
+
+    # The transfers grouped per command: [(command, data)]
+    def commands(self):
+        commands = []
+        for (dc, data) in self.transfers:
+            if dc:
+                (command, params) = commands[-1]
+                commands[-1] = (command, params + data)
+            else:
+                commands.extend((command, b'') for command in data)
+        return commands
+
+    # The data sent with the last `command`
+    def last(self, command):
+        for (sent, data) in reversed(self.commands()):
+            if sent == command:
+                return data
+        raise AssertionError("command 0x%02X not sent" % command)
+
+
+bus = Bus()
+
+
+class SpiDev:
+    max_speed_hz = 0
+    mode = 0
+
+    def open(self, bus, device):
+        pass
+
+    def close(self):
+        pass
+
+    # Like spidev, takes a list of ints or a buffer. bytes() rejects ints out
+    # of range(256), which spidev would silently truncate.
+    def writebytes(self, data):
+        data = bytes(data)
+        if bus.keep:
+            bus.transfers.append((bus.dc, data))
+
+    writebytes2 = writebytes
+    xfer3 = writebytes
+
+
+class LED:
+    def __init__(self, pin):
+        self.pin = pin
+        self.value = 0
+
+    def on(self):
+        self.value = 1
+        if self.pin == DC_PIN:
+            bus.dc = 1
+
+    def off(self):
+        self.value = 0
+        if self.pin == DC_PIN:
+            bus.dc = 0
+
+    def close(self):
+        pass
+
+
+class Button:
+    # The panel is never busy
+    def __init__(self, pin, pull_up=False):
+        self.pin = pin
+        self.value = 1
+
+    def wait_for_press(self, timeout=None):
+        return True
+
+    def wait_for_release(self, timeout=None):
+        return True
+
+    def close(self):
+        pass
+
+
+class Popen:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def communicate(self):
+        return ("Model\t: Raspberry Pi Zero 2 W", None)
+
+
+def load_epdconfig():
+    sys.modules['spidev'] = types.SimpleNamespace(SpiDev=SpiDev)
+    sys.modules['gpiozero'] = types.SimpleNamespace(LED=LED, Button=Button)
+    # imported, but not used, by a few drivers
+    sys.modules['RPi.GPIO'] = types.SimpleNamespace()
+    sys.modules['RPi'] = types.SimpleNamespace(GPIO=sys.modules['RPi.GPIO'])
+    popen = subprocess.Popen
+    subprocess.Popen = Popen
+    try:
+        from waveshare_epd import epdconfig
+    finally:
+        subprocess.Popen = popen
+    # no spidev module parameters to read from /sys, and no panel to wait for
+    epdconfig.implementation.SPI_BUFSIZ = 4096
+    epdconfig.delay_ms = lambda delaytime: None
+    return epdconfig
+
+
+load_epdconfig()
+
+
+@pytest.fixture
+def spi():
+    bus.clear()
+    bus.keep = True
+    return bus
+
+
+# Wall clock benchmarks only run with --bench, as their timings depend on
+# the machine and its load
+def pytest_addoption(parser):
+    parser.addoption('--bench', action='store_true', help="run the benchmarks marked with bench")
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "bench: wall clock benchmark, skipped without --bench")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--bench'):
+        return
+    skip = pytest.mark.skip(reason="benchmark, run with --bench")
+    for item in items:
+        if 'bench' in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,323 @@
+# Benchmarks of the Python hot paths against the loops they replaced. The
+# results are checked against the old loops on every run. The timings only
+# run with --bench: they assert a conservative speedup and print both
+# timings (add -s to see them).
+import time
+
+import pytest
+from PIL import Image
+
+from waveshare_epd import epdbuffer
+from piink import Framebuffer
+from test_epdbuffer import loop_getbuffer, noise
+
+
+# Best wall time in milliseconds of `repeat` calls
+def best_ms(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(name, old, new):
+    print("\n%-40s %9.2f ms -> %8.3f ms (%.0fx)" % (name, old, new, old / new))
+
+
+# (width, height, portrait)
+GETBUFFER_SIZES = [(width, height, portrait) for (width, height) in ((960, 680), (800, 480)) for portrait in (False, True)]
+
+
+def getbuffer_image(width, height, portrait):
+    return noise('L', (height, width) if portrait else (width, height), 0)
+
+
+@pytest.mark.parametrize('width,height,portrait', GETBUFFER_SIZES)
+def test_getbuffer_matches_loop(width, height, portrait):
+    image = getbuffer_image(width, height, portrait)
+    assert bytes(epdbuffer.getbuffer(image, width, height)) == bytes(loop_getbuffer(image, width, height))
+
+
+@pytest.mark.bench
+def test_bench_getbuffer():
+    for (width, height, portrait) in GETBUFFER_SIZES:
+        image = getbuffer_image(width, height, portrait)
+        old = best_ms(lambda: loop_getbuffer(image, width, height), 1)
+        new = best_ms(lambda: epdbuffer.getbuffer(image, width, height))
+        report("getbuffer %dx%d%s" % (width, height, " portrait" if portrait else ""), old, new)
+        assert new * 5 < old
+
+
+# Display.display before the framebuffer: XOR every byte of the image, then
+# epd7in5_V2.display built the old data plane as a list of ~x
+def loop_planes(image):
+    buffer = bytearray(image.tobytes())
+    for i in range(0, len(buffer)):
+        buffer[i] ^= 0xFF
+    image1 = [0xFF] * len(buffer)
+    for i in range(len(buffer)):
+        image1[i] = ~buffer[i]
+    return (buffer, image1)
+
+
+def test_planes_match_loop():
+    framebuffer = Framebuffer(noise('1', (800, 480), 0))
+    (buffer, image1) = loop_planes(framebuffer.image)
+    assert framebuffer.planes() == (bytes(buffer), bytes(b & 0xFF for b in image1))
+
+
+@pytest.mark.bench
+def test_bench_planes():
+    framebuffer = Framebuffer(noise('1', (800, 480), 0))
+    old = best_ms(lambda: loop_planes(framebuffer.image), 1)
+    new = best_ms(framebuffer.planes)
+    report("frame planes 800x480", old, new)
+    assert new * 2 < old
+
+
+# Display.display_partial before the framebuffer: one XOR per window byte
+def loop_window(image, x, y, width, height):
+    data = image.tobytes()
+    stride = image.width // 8
+    x0 = x // 8
+    x1 = (x + width + 7) // 8
+    scan_width = x1 - x0
+    buffer = bytearray(scan_width * height)
+    for i in range(0, height):
+        for j in range(0, scan_width):
+            buffer[i * scan_width + j] = data[(y + i) * stride + (x0 + j)] ^ 0xFF
+    return buffer
+
+
+# (x, y, width, height): the clock and greeter widgets, a clock digit,
+# unaligned windows and the full screen
+WINDOWS = [
+    (0, 0, 800, 160),
+    (0, 160, 800, 320),
+    (100, 5, 24, 24),
+    (3, 7, 101, 33),
+    (397, 200, 250, 250),
+    (0, 0, 800, 480),
+]
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+def test_window_matches_loop(window):
+    framebuffer = Framebuffer(noise('1', (800, 480), 0))
+    assert framebuffer.window(*window) == loop_window(framebuffer.image, *window)
+
+
+@pytest.mark.bench
+def test_bench_window():
+    framebuffer = Framebuffer(noise('1', (800, 480), 0))
+    image = framebuffer.image
+    (old_total, new_total) = (0, 0)
+    for window in WINDOWS:
+        # the old loop converted the whole image for every window as well
+        old = best_ms(lambda: loop_window(image, *window), 1)
+        new = best_ms(lambda: framebuffer.window(*window))
+        report("window %d,%d %dx%d" % window, old, new)
+        old_total += old
+        new_total += new
+    assert new_total * 10 < old_total
+
+
+def test_bench_event_bursts(monkeypatch):
+    import asyncio
+    import piink
+
+    modes = []
+    refreshes = []
+    (set_mode, display_partial) = (piink.Display.set_mode, piink.Display.display_partial)
+
+    async def record_mode(self, mode):
+        await set_mode(self, mode)
+        modes.append(mode)
+
+    async def count(self, *region):
+        refreshes.append(region)
+        await display_partial(self, *region)
+
+    monkeypatch.setattr(piink.Display, 'set_mode', record_mode)
+    monkeypatch.setattr(piink.Display, 'display_partial', count)
+
+    # pic/Font.ttc, the greeter's face, is installed on the device only
+    load = piink.FontRegistry.load
+
+    def load_with_greeter_font():
+        fonts = load()
+        fonts.faces.setdefault('Font', fonts.faces['FiraMono-Regular'])
+        return fonts
+
+    monkeypatch.setattr(piink.FontRegistry, 'load', load_with_greeter_font)
+
+    async def wait_for(condition, ui):
+        while not condition():
+            if ui.done():
+                ui.result()
+            await asyncio.sleep(0.01)
+
+    async def feed(bursts, size):
+        queue = asyncio.Queue(maxsize=piink.QUEUE_SIZE)
+        ui = asyncio.create_task(piink.ui_handler(queue))
+        await wait_for(lambda: piink.DisplayMode.PARTIAL in modes, ui)
+        start = time.perf_counter()
+        for burst in range(bursts):
+            for i in range(size):
+                await queue.put(piink.Event(kind=piink.EventKind.UPDATE, target=1, data="Name %d.%d" % (burst, i)))
+            # wait for the burst to be refreshed
+            await wait_for(lambda: len(refreshes) > burst, ui)
+        elapsed = time.perf_counter() - start
+        ui.cancel()
+        return elapsed
+
+    (bursts, size) = (20, 200)
+    elapsed = asyncio.run(feed(bursts, size))
+    events = bursts * size
+    print("\n%d events in %d bursts: %d refreshes, %.4f refreshes per event, %.0f events/s"
+          % (events, bursts, len(refreshes), len(refreshes) / events, events / elapsed))
+    assert len(refreshes) <= 2 * bursts
+
+
+CLOCK = "12:34 // Wednesday, 17.10.26"
+PARAGRAPH = "\n".join(["The quick brown fox jumps over the lazy dog, %d times. AVA Wolf Type." % i for i in range(12)])
+# Glyphs which sit off their outline box, lines in which only spaces reach
+# above the baseline and glyphs with a negative left bearing
+EDGES = "_ _\n. ,\njj (k) {t}\n%/\\`~"
+TEXTS = [("clock", CLOCK, (800, 160)), ("paragraph", PARAGRAPH, (800, 480))]
+
+
+def freetype_text(text, size, font):
+    from PIL import ImageDraw
+
+    image = Image.new('1', size, 255)
+    ImageDraw.Draw(image).text((5, 5), text, font=font, fill=0)
+    return image
+
+
+def atlas_text(glyphs, text, size, font):
+    image = Image.new('1', size, 255)
+    glyphs.text(image, (5, 5), text, font, 0)
+    return image
+
+
+@pytest.mark.parametrize('face', ['FiraMono-Regular', 'FiraMono-Medium', 'FiraMono-Bold'])
+@pytest.mark.parametrize('size', [11, 12, 16, 24, 30, 47])
+def test_glyph_atlas_matches_freetype(face, size):
+    from PIL import ImageChops
+    import piink
+
+    font = piink.FontRegistry.load().get(face, size)
+    glyphs = piink.GlyphAtlas()
+    for text in (CLOCK, PARAGRAPH, EDGES):
+        image_size = (1200, 900)
+        assert ImageChops.difference(atlas_text(glyphs, text, image_size, font), freetype_text(text, image_size, font)).getbbox() == None
+
+
+@pytest.mark.bench
+def test_bench_glyph_atlas():
+    import piink
+
+    font = piink.FontRegistry.load().get('FiraMono-Regular', 24)
+    glyphs = piink.GlyphAtlas()
+    for (name, text, size) in TEXTS:
+        atlas_text(glyphs, text, size, font)
+        old = best_ms(lambda: freetype_text(text, size, font), 10)
+        new = best_ms(lambda: atlas_text(glyphs, text, size, font), 10)
+        report("text %s" % name, old, new)
+        assert new < old
+
+
+# One plane of the old display_4Gray loops: the if/elif chain mapped the
+# top two bits of each pixel to a plane bit, `levels` holds its results
+# for 0x00, 0x40, 0x80 and 0xC0
+def loop_split_plane(image, levels):
+    buf = [0x00] * (len(image) // 2)
+    for i in range(0, len(buf)):
+        temp3 = 0
+        for j in range(0, 2):
+            temp1 = image[i * 2 + j]
+            for k in range(0, 4):
+                temp2 = temp1 & 0xC0
+                if temp2 == 0xC0:
+                    temp3 |= levels[3]
+                elif temp2 == 0x00:
+                    temp3 |= levels[0]
+                elif temp2 == 0x80:
+                    temp3 |= levels[2]
+                else:
+                    temp3 |= levels[1]
+                if j != 1 or k != 3:
+                    temp3 <<= 1
+                temp1 <<= 2
+        buf[i] = temp3
+    return buf
+
+
+LEVELS = ((0, 0, 1, 1), (0, 1, 0, 1))
+SPLIT_SIZES = [(400, 300), (960, 680)]
+
+
+def gray_image(width, height):
+    import random
+
+    return random.Random(0).randbytes(width * height // 4)
+
+
+@pytest.mark.parametrize('width,height', SPLIT_SIZES)
+def test_split_4Gray_matches_loop(width, height):
+    image = gray_image(width, height)
+    planes = epdbuffer.split_4Gray(image, *LEVELS)
+    assert [bytes(plane) for plane in planes] == [bytes(loop_split_plane(image, l)) for l in LEVELS]
+
+
+@pytest.mark.bench
+def test_bench_split_4Gray():
+    levels = LEVELS
+    for (width, height) in SPLIT_SIZES:
+        image = gray_image(width, height)
+        old = best_ms(lambda: [loop_split_plane(image, l) for l in levels], 1)
+        new = best_ms(lambda: epdbuffer.split_4Gray(image, *levels))
+        report("split_4Gray %dx%d" % (width, height), old, new)
+        assert new * 20 < old
+
+
+# The old getbuffer of the ACeP drivers: a new palette image per call, PIL's
+# default Floyd-Steinberg dithering and a nibble loop per pixel pair
+def loop_getbuffer_7Color(image):
+    pal_image = Image.new("P", (1,1))
+    pal_image.putpalette( (0,0,0,  255,255,255,  0,255,0,   0,0,255,  255,0,0,  255,255,0, 255,128,0) + (0,0,0)*249)
+    image_7color = image.convert("RGB").quantize(palette=pal_image)
+    buf_7color = bytearray(image_7color.tobytes('raw'))
+    buf = [0x00] * (len(buf_7color) // 2)
+    idx = 0
+    for i in range(0, len(buf_7color), 2):
+        buf[idx] = (buf_7color[i] << 4) + buf_7color[i+1]
+        idx += 1
+    return buf
+
+
+def load_photo():
+    import os
+
+    picdir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'pic')
+    return Image.open(os.path.join(picdir, '7in3f1.bmp')).convert('RGB')
+
+
+def test_getbuffer_7Color_matches_loop():
+    image = load_photo()
+    assert epdbuffer.getbuffer_7Color(image, *image.size) == bytes(loop_getbuffer_7Color(image))
+
+
+@pytest.mark.bench
+def test_bench_getbuffer_7Color():
+    photo = load_photo()
+    (width, height) = photo.size
+    old = best_ms(lambda: loop_getbuffer_7Color(photo), 1)
+    for dither in (Image.Dither.NONE, Image.Dither.ORDERED, Image.Dither.FLOYDSTEINBERG):
+        new = best_ms(lambda: epdbuffer.getbuffer_7Color(photo, width, height, dither))
+        report("getbuffer_7Color %dx%d %s" % (width, height, dither.name), old, new)
+        assert new * 2 < old
@@ -0,0 +1,71 @@
+import importlib
+import types
+
+import pytest
+
+from waveshare_epd import epdconfig, epdcalibration, epd7in5_V2
+
+
+# Drivers that re-send GET_STATUS (0x71) while the panel is busy
+POLLING = ['epd1in02', 'epd2in13b_V3', 'epd2in13d', 'epd2in9b_V3', 'epd2in9d',
+           'epd4in2', 'epd5in83b_V2', 'epd7in5_V2', 'epd7in5_V2_old', 'epd7in5b_V2']
+
+
+# Time as seen by epdconfig.busy_poll, advanced by the fake busy waits
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(epdconfig, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+@pytest.mark.parametrize('name', ['epd2in9_V2', 'epd4in2', 'epd5in65f', 'epd7in3f'])
+def test_hung_busy_line_raises(monkeypatch, clock, name):
+    timeouts = []
+
+    def hung(level, timeout=None):
+        timeouts.append(timeout)
+        clock[0] += timeout
+        return False
+
+    monkeypatch.setattr(epdconfig, 'busy_wait', hung)
+    epd = importlib.import_module('waveshare_epd.' + name).EPD()
+    with pytest.raises(epdconfig.BusyTimeout):
+        epd.init()
+    assert sum(timeouts) == pytest.approx(epdcalibration.DEFAULT_TIMEOUT)
+
+
+@pytest.mark.parametrize('name', POLLING)
+def test_busy_wait_repolls_status(spi, monkeypatch, name):
+    waits = []
+
+    def busy_twice(level, timeout=None):
+        waits.append(timeout)
+        return len(waits) > 2
+
+    epd = importlib.import_module('waveshare_epd.' + name).EPD()
+    monkeypatch.setattr(epdconfig, 'busy_wait', busy_twice)
+    spi.clear()
+    epd.ReadBusy()
+    # one 0x71 before each of the three slices
+    assert [command for (command, data) in spi.commands()] == [0x71] * 3
+    assert all(timeout <= 0.2 for timeout in waits)
+
+
+def test_epd7in5_V2_retries_a_hung_refresh_once(spi, monkeypatch, clock):
+    # no prediction yet, the refresh waits DEFAULT_TIMEOUT
+    monkeypatch.setattr(epdcalibration, 'calibration', epdcalibration.BusyCalibration())
+    epd = epd7in5_V2.EPD()
+    epd.init()
+
+    # busy until the first wait gives up, then idle
+    def hang_once(level, timeout=None):
+        released = clock[0] >= epdcalibration.DEFAULT_TIMEOUT - 1e-6
+        clock[0] += timeout
+        return released
+
+    monkeypatch.setattr(epdconfig, 'busy_wait', hang_once)
+    epd.Clear()
+    assert epd.busy_timeouts == 1
+    # the retry reset the panel and sent the frame again
+    assert [command for (command, data) in spi.commands()].count(0x12) == 2
@@ -0,0 +1,65 @@
+import pytest
+from PIL import Image
+
+from waveshare_epd import epdbuffer, epd7in5_V2
+from piink import Framebuffer
+
+
+def pattern(width, height):
+    data = bytes((x * 31 + y * 17) & 0xFF for y in range(height) for x in range(width // 8))
+    return Image.frombytes('1', (width, height), data)
+
+
+# (x, y, width, height)
+WINDOWS = [
+    (3, 5, 17, 9),          # odd X range, spans three bytes
+    (8, 0, 16, 1),          # byte aligned
+    (7, 10, 2, 3),          # two pixels either side of a byte border
+    (0, 0, 1, 1),           # first pixel
+    (799, 479, 1, 1),       # last pixel
+    (793, 0, 7, 480),       # right edge, full height
+    (0, 0, 800, 160),       # clock area
+    (0, 0, 800, 480),       # full screen
+]
+
+
+@pytest.mark.parametrize('x,y,width,height', WINDOWS)
+def test_display_partial_sends_window(spi, x, y, width, height):
+    framebuffer = Framebuffer(pattern(800, 480))
+    epd = epd7in5_V2.EPD()
+    epd.init_part()
+    spi.clear()
+
+    epd.display_Partial(framebuffer.window(x, y, width, height), x, y, x + width, y + height)
+
+    x0 = x // 8 * 8
+    x1 = (x + width + 7) // 8 * 8
+    y1 = y + height
+    assert spi.last(0x90) == bytes([
+        x0 // 256, x0 % 256, (x1 - 1) // 256, (x1 - 1) % 256,
+        y // 256, y % 256, (y1 - 1) // 256, (y1 - 1) % 256,
+        0x01])
+    window = framebuffer.window(x, y, width, height)
+    assert len(window) == (x1 - x0) // 8 * height
+    assert spi.last(0x13) == bytes(window).translate(epdbuffer.INVERT)
+    # RAM 0x13 takes partial windows in PIL polarity
+    assert spi.last(0x13) == framebuffer.image.crop((x0, y, x1, y1)).tobytes()
+    assert epd.frame_bytes < len(window) + 64
+
+
+@pytest.mark.parametrize('cleanup', ['init', 'init_fast'])
+def test_cleanup_rewrites_both_planes(spi, cleanup):
+    framebuffer = Framebuffer(pattern(800, 480))
+    (buffer, inverted) = framebuffer.planes()
+    epd = epd7in5_V2.EPD()
+    epd.init()
+    epd.display(buffer, inverted)
+
+    epd.init_part()
+    epd.display_Partial(framebuffer.window(0, 0, 800, 160), 0, 0, 800, 160)
+    # an idle cleanup of the unchanged frame, with or without a reset
+    getattr(epd, cleanup)()
+    spi.clear()
+    epd.display(buffer, inverted)
+    assert spi.last(0x10) == inverted
+    assert spi.last(0x13) == buffer
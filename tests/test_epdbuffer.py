@@ -0,0 +1,106 @@
+import importlib
+import random
+
+import pytest
+from PIL import Image
+
+from waveshare_epd import epdbuffer
+
+
+# The per pixel loop the monochrome drivers used before epdbuffer.getbuffer
+def loop_getbuffer(image, width, height):
+    buf = [0xFF] * (int(width/8) * height)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    if(imwidth == width and imheight == height):
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0:
+                    buf[int((x + y * width) / 8)] &= ~(0x80 >> (x % 8))
+    elif(imwidth == height and imheight == width):
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = height - x - 1
+                if pixels[x, y] == 0:
+                    buf[int((newx + newy*width) / 8)] &= ~(0x80 >> (y % 8))
+    return buf
+
+
+# The tobytes and XOR loop of the epd7in5_V2 family, in panel polarity
+def xor_getbuffer(image, width, height):
+    img = image
+    imwidth, imheight = img.size
+    if(imwidth == width and imheight == height):
+        img = img.convert('1')
+    elif(imwidth == height and imheight == width):
+        img = img.rotate(90, expand=True).convert('1')
+    else:
+        return [0x00] * (int(width/8) * height)
+    buf = bytearray(img.tobytes('raw'))
+    for i in range(len(buf)):
+        buf[i] ^= 0xFF
+    return buf
+
+
+LOOP_DRIVERS = [
+    'epd13in3b', 'epd13in3k', 'epd1in02', 'epd1in54', 'epd1in54_V2', 'epd1in54c',
+    'epd2in13b_V3', 'epd2in13bc', 'epd2in13d', 'epd2in66', 'epd2in66b', 'epd2in7',
+    'epd2in7_V2', 'epd2in7b', 'epd2in7b_V2', 'epd2in9', 'epd2in9_V2', 'epd2in9b_V3',
+    'epd2in9b_V4', 'epd2in9bc', 'epd2in9d', 'epd3in52', 'epd3in7', 'epd4in2',
+    'epd4in26', 'epd4in2_V2', 'epd4in2b_V2', 'epd4in2bc', 'epd5in79', 'epd5in79b',
+    'epd5in83_V2', 'epd5in83b_V2', 'epd5in83bc', 'epd7in5b_HD', 'epd7in5bc',
+]
+
+XOR_DRIVERS = ['epd7in5_V2', 'epd7in5_V2_old', 'epd7in5b_V2']
+
+
+# A driver without its constructor, some of which open the hardware
+def panel(name):
+    module = importlib.import_module('waveshare_epd.' + name)
+    epd = module.EPD.__new__(module.EPD)
+    epd.width = module.EPD_WIDTH
+    epd.height = module.EPD_HEIGHT
+    return epd
+
+
+def noise(mode, size, seed):
+    bands = len(mode) if mode != '1' else 1
+    data = random.Random(seed).randbytes(size[0] * size[1] * bands)
+    if mode == '1':
+        return Image.frombytes('L', size, data).convert('1', dither=Image.Dither.NONE)
+    return Image.frombytes(mode, size, data)
+
+
+# (mode, portrait, size change): landscape, portrait and a wrong size
+IMAGES = [('1', False, 0), ('L', True, 0), ('RGB', False, 8)]
+
+
+def images(epd):
+    for (i, (mode, portrait, grow)) in enumerate(IMAGES):
+        size = (epd.height, epd.width) if portrait else (epd.width, epd.height + grow)
+        yield noise(mode, size, i)
+
+
+@pytest.mark.parametrize('name', LOOP_DRIVERS)
+def test_getbuffer_matches_loop(name):
+    epd = panel(name)
+    for image in images(epd):
+        assert bytes(epd.getbuffer(image)) == bytes(loop_getbuffer(image, epd.width, epd.height))
+
+
+@pytest.mark.parametrize('name', XOR_DRIVERS)
+def test_getbuffer_matches_xor_loop(name):
+    epd = panel(name)
+    for image in images(epd):
+        assert bytes(epd.getbuffer(image)) == bytes(xor_getbuffer(image, epd.width, epd.height))
+
+
+@pytest.mark.parametrize('name', ['epd1in54b', 'epd1in54b_V2'])
+def test_getbuffer_rejects_wrong_size(name):
+    epd = panel(name)
+    image = noise('L', (epd.width, epd.height), 0)
+    assert bytes(epd.getbuffer(image)) == bytes(loop_getbuffer(image, epd.width, epd.height))
+    with pytest.raises(ValueError):
+        epd.getbuffer(noise('L', (epd.width, epd.height + 8), 0))
@@ -0,0 +1,56 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import piink
+from piink import MAX_PARTIAL_REFRESHES, REFRESH_TILE, Display, DisplayMode, Framebuffer, RefreshPolicy
+from waveshare_epd import epdcalibration, epdconfig, epd7in5_V2
+
+
+def test_refresh_policy_counts_overlapping_regions():
+    policy = RefreshPolicy()
+    # tight boxes of a changing clock string, never the same region twice
+    for i in range(MAX_PARTIAL_REFRESHES):
+        assert policy.cleanup() == None
+        policy.record(DisplayMode.PARTIAL, (5 + i % 7, 5, 40 + i, 19 + i % 3))
+    assert policy.cleanup() == DisplayMode.FAST
+
+    policy.record(DisplayMode.FAST)
+    assert policy.cleanup() == None
+
+
+def test_refresh_policy_counts_every_overlapped_tile():
+    policy = RefreshPolicy()
+    policy.record(DisplayMode.PARTIAL, (REFRESH_TILE - 1, 0, 2, REFRESH_TILE + 1))
+    assert policy.partial == {(0, 0): 1, (1, 0): 1, (0, 1): 1, (1, 1): 1}
+    policy.record(DisplayMode.PARTIAL, (0, 0, REFRESH_TILE, REFRESH_TILE))
+    assert policy.partial == {(0, 0): 2, (1, 0): 1, (0, 1): 1, (1, 1): 1}
+
+
+def test_calibration_survives_a_restart(monkeypatch, tmp_path):
+    monkeypatch.setattr(piink, 'CALIBRATION_PATH', str(tmp_path / 'calibration.json'))
+    monkeypatch.setattr(epdcalibration, 'calibration', epdcalibration.BusyCalibration())
+    piink.load_calibration()
+    epdcalibration.calibration.record('epd7in5_V2', 'partial', 0.4)
+    piink.save_calibration()
+
+    monkeypatch.setattr(epdcalibration, 'calibration', epdcalibration.BusyCalibration())
+    piink.load_calibration()
+    assert epdcalibration.calibration.predict('epd7in5_V2', 'partial') == 0.4
+
+
+def test_display_reinitialises_after_a_busy_timeout(spi):
+    epd = epd7in5_V2.EPD()
+    display = Display(epd=epd, framebuffer=Framebuffer(Image.new("1", (800, 480), 255)),
+                      worker=ThreadPoolExecutor(max_workers=1))
+    asyncio.run(display.set_mode(DisplayMode.PARTIAL))
+
+    def hung():
+        raise epdconfig.BusyTimeout("e-Paper busy for too long")
+
+    spi.clear()
+    asyncio.run(display.run(hung))
+    # the whole partial table again, as after a reset
+    commands = [command for (command, data) in spi.commands() if command != 0x71]
+    assert commands == [command for (command, params, delay, busy) in epd.init_part_sequence]
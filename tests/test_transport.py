@@ -0,0 +1,137 @@
+import importlib
+import tracemalloc
+
+import pytest
+
+from waveshare_epd import epdbuffer, epdconfig, epd7in5_V2
+
+
+def test_spi_chunks_views_buffers():
+    data = bytes(range(10))
+    chunks = list(epdconfig.spi_chunks(data, 4))
+    assert [bytes(c) for c in chunks] == [data[0:4], data[4:8], data[8:10]]
+    assert all(isinstance(c, memoryview) for c in chunks)
+
+
+def test_spi_chunks_truncates_list_items():
+    # ~x of a byte is negative, spidev sends its low byte
+    data = [~0x00, ~0xFF, ~0x5A, 0x12]
+    assert b''.join(epdconfig.spi_chunks(data, 3)) == bytes([0xFF, 0x00, 0xA5, 0x12])
+
+
+def test_spi_writebyte2_takes_inverted_list(spi):
+    epdconfig.spi_writebyte2([~b for b in range(256)] * 20)
+    assert b''.join(data for (dc, data) in spi.transfers) == bytes(range(255, -1, -1)) * 20
+    assert max(len(data) for (dc, data) in spi.transfers) <= epdconfig.implementation.SPI_BUFSIZ
+
+
+# Drivers sending the inverse of a plane: (module, display args, command
+# receiving the inverse of the last argument)
+INVERTING = [
+    ('epd1in54b_V2', 2, 0x26),
+    ('epd2in13_V2', 1, 0x26),
+    ('epd2in66b', 2, 0x26),
+    ('epd2in7b_V2', 2, 0x26),
+    ('epd5in83_V2', 1, 0x13),
+    ('epd5in83b_V2', 2, 0x13),
+    ('epd7in5_V2_old', 1, 0x10),
+]
+
+
+def frame(size, seed):
+    return bytearray((i * 7 + seed) & 0xFF for i in range(size))
+
+
+@pytest.mark.parametrize('name,planes,command', INVERTING)
+def test_inverted_plane(spi, name, planes, command):
+    epd = importlib.import_module('waveshare_epd.' + name).EPD()
+    size = (epd.width + 7) // 8 * epd.height
+    image = frame(size, 3)
+    spi.clear()
+    if name == 'epd2in13_V2':
+        epd.displayPartial(image)
+    else:
+        epd.display(*[image] * planes)
+    assert spi.last(command) == bytes(image).translate(epdbuffer.INVERT)
+
+
+# Peak bytes allocated by `refresh` after two warm-up calls. A list of n
+# ints needs 8 * n bytes for its pointers alone, so a peak below that for a
+# frame of n bytes rules out a list per byte.
+def refresh_peak(spi, refresh):
+    refresh()
+    refresh()
+    spi.keep = False
+    tracemalloc.start()
+    try:
+        refresh()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        spi.keep = True
+
+
+@pytest.mark.parametrize('name,planes,command', INVERTING)
+def test_display_allocates_no_int_list(spi, name, planes, command):
+    epd = importlib.import_module('waveshare_epd.' + name).EPD()
+    size = (epd.width + 7) // 8 * epd.height
+    image = frame(size, 0)
+    if name == 'epd2in13_V2':
+        refresh = lambda: epd.displayPartial(image)
+    else:
+        refresh = lambda: epd.display(*[image] * planes)
+    assert refresh_peak(spi, refresh) < 8 * size
+
+
+def test_epd7in5_V2_steady_state_allocates_no_int_list(spi):
+    epd = epd7in5_V2.EPD()
+    epd.init()
+    size = epd.width * epd.height // 8
+    frames = [frame(size, 0), frame(size, 1)]
+
+    def refresh():
+        frames.reverse()
+        epd.display(frames[0])
+
+    assert refresh_peak(spi, refresh) < 8 * size
+    assert refresh_peak(spi, epd.Clear) < 8 * size
+
+
+def test_epd7in5_V2_old_partial_allocates_no_int_list(spi):
+    epd = importlib.import_module('waveshare_epd.epd7in5_V2_old').EPD()
+    size = epd.width * epd.height // 8
+    # x 16..120, y 5..40
+    window = frame(13 * 35, 0)
+    spi.clear()
+    epd.display_Partial(window, 16, 5, 120, 40)
+    # the inverted window, then the rest of a full frame in white
+    assert spi.last(0x13) == bytes(window).translate(epdbuffer.INVERT) + bytes([0xFF]) * (size - len(window))
+    assert refresh_peak(spi, lambda: epd.display_Partial(window, 16, 5, 120, 40)) < 8 * size
+
+
+CLEARING = ['epd13in3k', 'epd2in13b_V4', 'epd2in66', 'epd5in65f', 'epd7in5', 'epd7in5_HD', 'epd7in5b_V2']
+
+
+@pytest.mark.parametrize('name', CLEARING)
+def test_clear_allocates_no_int_list(spi, name):
+    epd = importlib.import_module('waveshare_epd.' + name).EPD()
+    assert refresh_peak(spi, epd.Clear) < 8 * epd.width * epd.height // 8
+
+
+# Partial windows sent as one transaction: (module, call, 0x90 params)
+WINDOWS = [
+    ('epd1in02', lambda epd: epd.DisplayPartial(bytes(1280), bytes(1280)), [0, 79, 0, 127, 0x00]),
+    ('epd2in13d', lambda epd: epd.DisplayPartial(bytes(2756)), [0, 103, 0, 0, 0, 211, 0x28]),
+    ('epd2in9d', lambda epd: epd.DisplayPartial(bytes(4736)), [0, 127, 0, 0, 1, 39, 0x28]),
+    ('epd7in5_V2_old', lambda epd: epd.display_Partial(bytes(48000), 16, 5, 120, 40), [0, 16, 0, 119, 0, 5, 0, 39, 0x01]),
+]
+
+
+@pytest.mark.parametrize('name,call,params', WINDOWS)
+def test_partial_window_in_one_transaction(spi, name, call, params):
+    epd = importlib.import_module('waveshare_epd.' + name).EPD()
+    spi.clear()
+    call(epd)
+    assert spi.last(0x90) == bytes(params)
+    window = [data for (dc, data) in spi.transfers if dc and data == bytes(params)]
+    assert len(window) == 1